@@ -7,8 +7,31 @@
 import re
 import os
 import sys
-from typing import Dict, Tuple, List, Optional, NamedTuple
-from datetime import datetime
+import marshal
+import functools
+import itertools
+import threading
+import time
+from collections.abc import Mapping
+from typing import Dict, Tuple, List, Optional, NamedTuple, Iterable, Iterator
+
+
+# Version of the parsing/substitution rules. Change it whenever the result
+# of parsing the same file may change, so old compiled caches are ignored.
+PARSER_VERSION = 4 # 3: limits of expansion, 4: the total limit counts only the added text
+
+# Compiled cache of parsed files (see 'load_lng')
+CACHE_DIR_NAME = "__lngcache__"
+CACHE_MAGIC = "LNGCACHE"
+
+# Default limits of expanding references (see 'LngParser'), None -no limit.
+# A few levels of blocks that each use the previous one twice grow exponentially,
+# so a value that goes over a limit is reported as an error and left unexpanded.
+# Only expansion counts: a value that is not longer than the text of its block
+# is never over a limit, however big the pack is
+MAX_EXPANDED_SIZE = 1 << 22     # characters of one value
+MAX_DEPTH = 10000               # nesting of references
+MAX_TOTAL_SIZE = 1 << 26        # characters added by references to all values together
 
 
 class BlockSettings(NamedTuple):
@@ -16,6 +39,296 @@ class BlockSettings(NamedTuple):
     vbegin: str
     vend: str
 
+# Kinds of events of streaming parsing (see 'LngParser.iter_events')
+EVENT_SETTINGS = "settings"         # settings line; 'settings' are the new settings
+EVENT_BLOCK_START = "block_start"   # block header with names
+EVENT_LINE = "line"                 # a line of the block text
+EVENT_BLOCK_END = "block_end"       # block completed; 'text' is the whole block text
+
+
+class LngEvent(NamedTuple):
+    """Event of streaming parsing"""
+    kind: str
+    line: int                 # line number where the event happened
+    names: Tuple[str, ...]    # block names (empty for settings)
+    text: str                 # line text, or the whole block text for EVENT_BLOCK_END
+    settings: BlockSettings   # settings in effect for the block
+    start_line: int           # line number where the block starts
+
+
+class Reference(NamedTuple):
+    """Reference to a block in the text: $name$ or $name alias$"""
+    name: str
+    alias: Optional[str]
+    text: str   # the reference as it is written in the text
+    inner: str  # the text between the delimiters (stripped)
+
+
+@functools.lru_cache(maxsize=None)
+def _reference_regex(vbegin: str, vend: str) -> 're.Pattern':
+    """Compiled regular expression of a reference (one per pair of delimiters)"""
+    return re.compile(f'{re.escape(vbegin)}(.+?){re.escape(vend)}')
+
+
+def tokenize_block(content: str, settings: BlockSettings) -> list:
+    """Splits the block text into segments: strings of text and 'Reference'.
+    Empty references ($$ or $ $) remain text"""
+    tokens = []
+    pos = 0
+    for match in _reference_regex(settings.vbegin, settings.vend).finditer(content):
+        inner = match.group(1).strip()
+        if not inner:
+            continue  # remains part of the text
+        start = match.start()
+        if start > pos:
+            tokens.append(content[pos:start])
+        # Understandable: "var" or "var alias"
+        parts = inner.split()
+        tokens.append(Reference(parts[0], parts[1] if len(parts) > 1 else None, match.group(0), inner))
+        pos = match.end()
+    if pos < len(content):
+        tokens.append(content[pos:])
+    return tokens
+
+
+class _Rope:
+    """Value of a block with references: the strings and the values of the
+    referenced blocks are shared, not copied, and the text is joined only when
+    the value is requested. So the memory of the second pass is proportional
+    to the source, not to the expanded text"""
+    __slots__ = ("parts", "size", "depth")
+
+    def __init__(self, parts: tuple, size: int, depth: int):
+        self.parts = parts    # str or _Rope
+        self.size = size      # length of the expanded text
+        self.depth = depth    # nesting of references (1 -only plain blocks are used)
+
+    def text(self) -> str:
+        """Joins the text (without recursion) and keeps only it in the rope"""
+        parts = self.parts
+        if len(parts) == 1 and parts[0].__class__ is str:
+            return parts[0]
+        if self.depth == 1:  # only strings, no other ropes
+            text = "".join(parts)
+            self.parts = (text,)
+            return text
+        out = []
+        stack = [iter(parts)]
+        while stack:
+            for part in stack[-1]:
+                if part.__class__ is _Rope:
+                    if len(part.parts) == 1:
+                        part = part.parts[0]  # already joined (or one string)
+                    if part.__class__ is _Rope:
+                        stack.append(iter(part.parts))
+                        break
+                out.append(part)
+            else:
+                stack.pop()
+        text = "".join(out)
+        self.parts = (text,)
+        return text
+
+
+# Severity of diagnostics (the same numbers as in the 'logging' module,
+# which is imported only when it is really used)
+DEBUG = 10      # progress of parsing
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+_SEVERITY_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+def _format_summary(errors: int, warnings: int) -> str:
+    strer = "Errors" if errors <= 0 else "ERRORS"  
+    strwr = "Warnings" if warnings <= 0 else "WARNINGS"
+    strE7 = "=======" if errors == 0 and warnings == 0 else "==!!!=="            
+    return f"{strE7} {strer}: {errors}  {strwr}: {warnings}"
+
+
+def _format_cycle(component: Tuple[Tuple[str, int], ...]) -> str:
+    names = ", ".join(f"'{name}' (Ln {line})" for name, line in component)
+    return f"circular references between blocks: {names}"
+
+
+# Texts of the diagnostics by code: a format string for 'args' or a function.
+# The text is made only when someone reads it (Diagnostic.message)
+MESSAGES = {
+    "start": "======= Start parsing file: {0}",
+    "pass1": "== 1 == First pass: simple reading...",
+    "pass2": "== 2 == Second pass: substitutions in dependency order...",
+    "finish": "======= Finishing file parsing: {0}",
+    "summary": _format_summary,
+    "file_not_found": "File not found: {0}",
+    "duplicate_names": "removed duplicate names, keeping only unique",
+    "block_overwritten": "block '{0}' is overwritten",
+    "multi_block_overwritten": "block '{0}' overwritten (created from multi-block declaration)",
+    "multi_block_created": "created {0} blocks with same content: {1}",
+    "vs_changed": "changing vs from '{0}' to '{1}'",
+    "settings_updated": "settings updated - vb='{0}', vbegin='{1}', vend='{2}', comment='{3}'",
+    "incomplete_settings": "incomplete settings line, expected 5 words, got {0}",
+    "cycle": _format_cycle,
+    "alias_overwritten": "alias '{0}' was overwritten. Is this really what you wanted?",
+    "alias_of_alias": "substitution '{0}': It is not allowed to create an alias for an alias!",
+    "not_found": "substitution '{0}' was not found! ('{1}')",
+    "expansion_limit": "the value would have {0} characters (the limit is {1}), references are not substituted",
+    "depth_limit": "references are nested {0} levels deep (the limit is {1}), they are not substituted",
+    "incremental": "lines {0}-{1} parsed again, {2} blocks resolved again",
+    "total_limit": "references would add more than {0} characters to all values together, they are not substituted",
+    "reload_failed": "hot reload of {0} failed: {1}",
+}
+
+
+class Diagnostic(NamedTuple):
+    """One message of the parser. The text is formatted only on request"""
+    severity: int
+    code: str      # key in MESSAGES
+    line: int      # line number (0 -unknown)
+    block: str     # block name ("" -not about a block)
+    args: tuple
+
+    @property
+    def message(self) -> str:
+        template = MESSAGES[self.code]
+        if callable(template):
+            return template(*self.args)
+        return template.format(*self.args)
+
+    def __str__(self) -> str:
+        if self.severity <= DEBUG:
+            return self.message
+        where = _SEVERITY_NAMES.get(self.severity, str(self.severity))
+        if self.line:
+            where += f" Ln {self.line}"
+        if self.block:
+            where += f" block '{self.block}'"
+        return f"{where}: {self.message}"
+
+    def as_dict(self) -> Dict:
+        return {"severity": _SEVERITY_NAMES.get(self.severity, self.severity), "code": self.code,
+                "line": self.line, "block": self.block, "args": list(self.args),
+                "message": self.message}
+
+
+class Diagnostics:
+    """Collector of parser diagnostics.
+    Records below 'level' are not even created, unless there are listeners
+    (or logging to the screen); by default only warnings and errors are kept"""
+
+    def __init__(self, level: int = WARNING):
+        self.level = level
+        self.records: List[Diagnostic] = []
+        self.listeners = []  # functions (record) -> None, receive records of all levels
+
+    def add(self, record: Diagnostic):
+        if record.severity >= self.level:
+            self.records.append(record)
+        for listener in self.listeners:
+            listener(record)
+
+    def wants(self, severity: int) -> bool:
+        """Whether a record of this severity is needed by someone"""
+        return severity >= self.level or bool(self.listeners)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def attach_logger(self, logger: Optional["logging.Logger"] = None):
+        """Forwards the records to the standard 'logging' module.
+        The text is formatted by 'logging' only if the record is really output.
+        Returns the listener (for 'remove_listener')"""
+        import logging
+        if logger is None:
+            logger = logging.getLogger(__name__)
+
+        def listener(record: Diagnostic):
+            if logger.isEnabledFor(record.severity):
+                logger.log(record.severity, "%s", record)
+        self.add_listener(listener)
+        return listener
+
+    def errors(self) -> List[Diagnostic]:
+        return [record for record in self.records if record.severity >= ERROR]
+
+    def warnings(self) -> List[Diagnostic]:
+        return [record for record in self.records if WARNING <= record.severity < ERROR]
+
+    def as_dicts(self) -> List[Dict]:
+        return [record.as_dict() for record in self.records]
+
+    def to_json(self, **kwargs) -> str:
+        import json
+        return json.dumps(self.as_dicts(), ensure_ascii=False, **kwargs)
+
+
+class ParseStats:
+    """Timings (seconds) and counters of parsing, filled on every parse
+    (also without logging to the screen)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.path = ""
+        self.source = ""              # "lng" (parsed), "cache" (compiled cache) or "lngc"
+        self.time_read = 0.0          # reading the file (or the compiled cache)
+        self.time_pass1 = 0.0         # first pass, without reading
+        self.time_pass2 = 0.0         # second pass (substitutions)
+        self.lines = 0
+        self.blocks = 0
+        self.setting_switches = 0     # settings lines
+        self.references = 0           # references to blocks substituted
+        self.alias_hits = 0           # substitutions of aliases
+        self.peak_resolved_size = 0   # the longest resolved value (characters)
+        self.expanded_size = 0        # all resolved values together (characters)
+        self.fallbacks = []           # (language, keys supplied), filled by lang.set_lang
+        self.warnings = 0
+        self.errors = 0
+
+    @property
+    def time_total(self) -> float:
+        return self.time_read + self.time_pass1 + self.time_pass2
+
+    def as_dict(self) -> Dict:
+        """All values (for logs or JSON)"""
+        ret = dict(vars(self))
+        ret["time_total"] = self.time_total
+        return ret
+
+    def __repr__(self) -> str:
+        return (f"ParseStats({self.path!r}, source={self.source!r}, "
+                f"read={self.time_read * 1000:.1f}ms, pass1={self.time_pass1 * 1000:.1f}ms, "
+                f"pass2={self.time_pass2 * 1000:.1f}ms, lines={self.lines}, blocks={self.blocks}, "
+                f"references={self.references}, errors={self.errors}, warnings={self.warnings})")
+
+
+READ_CHUNK = 1 << 16 # characters of lines read from the file at once
+
+
+def _timed_chunks(f, stats: ParseStats) -> Iterator[List[str]]:
+    """Lines of the open file in lists of about READ_CHUNK characters, adding the
+    time spent reading them to 'stats.time_read' (measured once per list, not per line)"""
+    clock = time.perf_counter
+    while True:
+        start = clock()
+        chunk = f.readlines(READ_CHUNK)
+        stats.time_read += clock() - start
+        if not chunk:
+            return
+        yield chunk
+
+
+def _starts_with_word(line: str, word: str) -> bool:
+    """The line begins with the word followed by whitespace or the end of the line
+    (the same as the regular expression '^word(\\s|$)', without a regular expression)"""
+    return line.startswith(word) and (len(line) == len(word) or line[len(word)].isspace())
+
+
 class LngParser:
     def __init__(self):
         # Standard settings
@@ -27,6 +340,20 @@ class LngParser:
         
         # We store blocks and their settings
         self.blocks: Dict[str, Tuple[str, BlockSettings]] = {}
+        # Line numbers where the blocks start (for messages)
+        self.block_lines: Dict[str, int] = {}
+        # Blocks split into text and references, and already resolved values (second pass)
+        self._tokens: Dict[str, list] = {}
+        self._resolved: Dict[str, str] = {}
+        # Blocks resolved with errors
+        self._failed = set()
+
+        # limits of expanding references (None -no limit)
+        self.max_expanded_size = MAX_EXPANDED_SIZE
+        self.max_depth = MAX_DEPTH
+        self.max_total_size = MAX_TOTAL_SIZE
+        self._expanded_total = 0  # characters added by references to the values resolved so far
+        self._added: Dict[str, int] = {}  # what each resolved block added to '_expanded_total'
 
         # how many warnings and errors
         self.warnings = 0
@@ -35,6 +362,12 @@ class LngParser:
         # display log on screen
         self.logging_to_screen = True
 
+        # messages of parsing (warnings and errors by default)
+        self.diagnostics = Diagnostics()
+
+        # timings and counters of the last parse
+        self.stats = ParseStats()
+
 
     def log(self, message: str, limitError: bool = True):
         """Logs a message with a timestamp"""
@@ -42,89 +375,151 @@ class LngParser:
             return
         if limitError and (self.warnings + self.errors > 20):   
             return
+        from datetime import datetime
         now = datetime.now()
         timestamp = f"{now:%Y-%m-%d %H:%M:%S}.{now.microsecond // 1000:03d}"
         print(f"[{timestamp}] {message}")
     
+    def _report(self, severity: int, code: str, line: int = 0, block: str = "", *args):
+        """Registers a diagnostic. Warnings and errors are always counted,
+        the record itself is created only if someone needs it"""
+        if severity >= ERROR:
+            self.errors += 1
+        elif severity >= WARNING:
+            self.warnings += 1
+        if not (self.logging_to_screen or self.diagnostics.wants(severity)):
+            return
+        record = Diagnostic(severity, code, line, block, args)
+        self.diagnostics.add(record)
+        if self.logging_to_screen:
+            self.log(str(record), limitError = code != "finish" and code != "summary")
+
     def _is_settings_line(self, line: str) -> bool:
         """Checks if a string is a settings string"""
-        pattern = f'^{re.escape(self.vs)}(\\s|$)'
-        return bool(re.match(pattern, line))
+        return _starts_with_word(line, self.vs)
     
     def _is_block_start_line(self, line: str) -> bool:
         """Checks if a string is the start of a block"""
-        pattern = f'^{re.escape(self.vb)}(\\s|$)'
-        return bool(re.match(pattern, line))
+        return _starts_with_word(line, self.vb)
     
     def parse_file(self, filepath: str) -> Dict[str, str]:
         """Parses the .lng file and returns a key->value dictionary (already with substitutions)"""
-        self.log(f"======= Start parsing file: {filepath}")
-        if not os.path.exists(filepath):
-            self.log(f"ERROR. File not found: {filepath}")
-            self.errors += 1
+        if not self.read_file(filepath):
             return {}
-        
-        with open(filepath, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        ret= self._resolve_all_references()
+        self._report(DEBUG, "finish", 0, "", filepath)
+        self._report(DEBUG, "summary", 0, "", self.errors, self.warnings)
+        return ret
+
+
+    def read_file(self, filepath: str) -> bool:
+        """Only the first pass: reads the blocks of the .lng file without substitutions.
+        Returns False if the file was not found"""
+        self._report(DEBUG, "start", 0, "", filepath)
+        if not os.path.exists(filepath):
+            self._report(ERROR, "file_not_found", 0, "", filepath)
+            return False
         
         # how many warnings and errors
         self.warnings = 0
         self.errors = 0
+        self.stats.reset()
+        self.stats.path = filepath
+        self.stats.source = "lng"
+
+        # the file is read in parts, without keeping all its lines in memory
+        start = time.perf_counter()
+        with open(filepath, 'r', encoding='utf-8') as f:
+            self._parse_blocks(itertools.chain.from_iterable(_timed_chunks(f, self.stats)))
+        self.stats.time_pass1 = time.perf_counter() - start - self.stats.time_read
+        self.stats.blocks = len(self.blocks)
+        self.stats.warnings = self.warnings
+        return True
 
-        self._parse_blocks(lines)
-        ret= self._resolve_all_references()
-        self.log(f"======= Finishing file parsing: {filepath}", limitError = False)
-        strer = "Errors" if self.errors <= 0 else "ERRORS"  
-        strwr = "Warnings" if self.warnings <= 0 else "WARNINGS"
-        strE7 = "=======" if self.errors == 0 and self.warnings == 0 else "==!!!=="            
-        self.log(f"{strE7} {strer}: {self.errors}  {strwr}: {self.warnings}", limitError = False)
-        return ret
-       
 
+    def iter_file_events(self, filepath: str) -> Iterator[LngEvent]:
+        """Streaming reading of the .lng file: events are generated as the file is read.
+        References are not resolved, memory does not depend on the file size"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            yield from self.iter_events(f)
+
+
+    def iter_file_blocks(self, filepath: str) -> Iterator[LngEvent]:
+        """Streaming reading of the .lng file: only completed blocks (EVENT_BLOCK_END)"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for event in self.iter_events(f, emit_lines=False):
+                if event.kind == EVENT_BLOCK_END:
+                    yield event
+       
 
-    def _parse_blocks(self, lines: List[str]):
+    def _parse_blocks(self, lines: Iterable[str]):
         """First pass: collecting all named blocks with their settings"""
+        self._report(DEBUG, "pass1")
+        stats = self.stats
+        for event in self.iter_events(lines, emit_lines=False):
+            if event.kind == EVENT_BLOCK_END:
+                self._save_blocks(list(event.names), event.text, event.settings,
+                                  event.line, event.start_line)
+            elif event.kind == EVENT_SETTINGS:
+                stats.setting_switches += 1
+
+
+    def iter_events(self, lines: Iterable[str], first_line: int = 1,
+                    emit_lines: bool = True) -> Iterator[LngEvent]:
+        """Goes through the lines and generates events: settings changed,
+        block started, line of a block, block ended (with the whole text of the block).
+        The lines can be any iterable, for example an open file.
+        'first_line' -number of the first given line, when a part of a file is read
+        (it must start with a settings line or a block line, with the settings
+        in effect at that place already set in the parser).
+        Without 'emit_lines' there are no EVENT_LINE events (the text of a block
+        is still in its EVENT_BLOCK_END), which is how the parser itself reads"""
         # A block can have multiple names (just a shorthand for representing blocks
         # since then the translator must implement them if necessary)
-        current_block_names = []  
+        current_block_names = ()  
         current_block_content = []
-        
-        self.log("== 1 == First pass: simple reading...")
 
         # Default settings for the first block
         current_settings = BlockSettings(self.vbegin, self.vend)
         block_settings = current_settings
-        n_line = 0  # line number
+        n_line = first_line - 1  # line number
+        block_line = 0  # line number where the current block starts
+        vs, vb = self.vs, self.vb  # read again after each settings line
         
         for line in lines:
             line = line.rstrip('\n')
             n_line += 1            
 
             # Checking if a string is a settings string
-            if self._is_settings_line(line) or (n_line == 1):
+            if n_line == 1 or (line.startswith(vs) and _starts_with_word(line, vs)):
                 # We save previous blocks if there are any
                 if current_block_names:
-                    self._save_blocks(current_block_names, current_block_content, block_settings, n_line)
+                    yield LngEvent(EVENT_BLOCK_END, n_line, current_block_names,
+                                   '\n'.join(current_block_content).rstrip(), block_settings, block_line)
                     current_block_content = []
-                    current_block_names = []
+                    current_block_names = ()
 
-                self._parse_settings_line(line)                
+                self._parse_settings_line(line, n_line)                
                 # Update current settings after changes
+                vs, vb = self.vs, self.vb
                 current_settings = BlockSettings(self.vbegin, self.vend)
+                yield LngEvent(EVENT_SETTINGS, n_line, (), line, current_settings, n_line)
                 continue
             
             # Checking if a string is the beginning of a block
-            if self._is_block_start_line(line):
+            if line.startswith(vb) and _starts_with_word(line, vb):
                 # We save previous blocks if there are any
                 if current_block_names:
-                    self._save_blocks(current_block_names, current_block_content, block_settings, n_line)
+                    yield LngEvent(EVENT_BLOCK_END, n_line, current_block_names,
+                                   '\n'.join(current_block_content).rstrip(), block_settings, block_line)
                     current_block_content = []
-                    current_block_names = []
+                    current_block_names = ()
                 
                 block_settings = current_settings
+                block_line = n_line
 
                 # Parsing the block string
-                vb_len = len(self.vb)
+                vb_len = len(vb)
                 rest_start = vb_len
                 if len(line) > vb_len and line[vb_len] == ' ':
                     rest_start = vb_len + 1
@@ -150,55 +545,58 @@ class LngParser:
                                 unique_names.append(name)
                         
                         if len(unique_names) != len(block_names):
-                            self.log(f"INFO Ln {n_line}: removed duplicate names, keeping only unique")
+                            self._report(INFO, "duplicate_names", n_line)
                         
-                        current_block_names = unique_names
+                        current_block_names = tuple(unique_names)
+                        yield LngEvent(EVENT_BLOCK_START, n_line, current_block_names, line, block_settings, n_line)
                     else:
                         # A line like "=== ; comment" is an empty block
-                        current_block_names = []
+                        current_block_names = ()
                 else:
                     # A line like "===" without anything after
-                    current_block_names = []
+                    current_block_names = ()
                     
                 continue
             
             # Add a line to the current blocks
             if current_block_names:
                 current_block_content.append(line)
+                if emit_lines:
+                    yield LngEvent(EVENT_LINE, n_line, current_block_names, line, block_settings, block_line)
         
         # Saving the last blocks
         if current_block_names:
-            self._save_blocks(current_block_names, current_block_content, block_settings, n_line)
+            yield LngEvent(EVENT_BLOCK_END, n_line, current_block_names,
+                           '\n'.join(current_block_content).rstrip(), block_settings, block_line)
+        self.stats.lines = n_line
 
 
-    def _save_blocks(self, block_names: List[str], content: List[str], 
-                    settings: BlockSettings, line_num: int):
+    def _save_blocks(self, block_names: List[str], block_text: str, 
+                    settings: BlockSettings, line_num: int, start_line: int = 0):
         """Saves multiple blocks with the same content"""
         if not block_names:
             return
         
-        block_text = '\n'.join(content).rstrip()
-        
         # We check and save each block
         main_block = block_names[0]
         for i, block_name in enumerate(block_names):
             if block_name in self.blocks:
                 if i == 0:
-                    self.log(f"WARNING Ln {line_num}: block '{block_name}' is overwritten")
-                    self.warnings += 1
+                    self._report(WARNING, "block_overwritten", line_num, "", block_name)
                 else:
                     # For other blocks the warning is milder
-                    self.log(f"INFO Ln {line_num}: block '{block_name}' overwritten (created from multi-block declaration)")
+                    self._report(INFO, "multi_block_overwritten", line_num, "", block_name)
             
             # Save the block
             self.blocks[block_name] = (block_text, settings)
+            self.block_lines[block_name] = start_line
         
         # Logging the creation of several blocks
         if len(block_names) > 1:
-            self.log(f"INFO Ln {line_num}: created {len(block_names)} blocks with same content: {', '.join(block_names)}")
+            self._report(INFO, "multi_block_created", line_num, "", len(block_names), ', '.join(block_names))
     
 
-    def _parse_settings_line(self, line: str):
+    def _parse_settings_line(self, line: str, n_line: int = 0):
         """Parses the settings string"""
         # Find the first word before the space
         line_stripped = line.strip()  # Removing possible spaces at the beginning        
@@ -210,7 +608,7 @@ class LngParser:
         new_vs = words[0]        
         # Checking if vs has changed
         if new_vs != self.vs:
-            self.log(f"INFO: changing vs from '{self.vs}' to '{new_vs}'")
+            self._report(INFO, "vs_changed", n_line, "", self.vs, new_vs)
             self.vs = new_vs        
         # The remaining words (starting from the second) are settings
         if len(words) >= 5:  # minimum 5 words: vs, vb, vbegin, vend, comment
@@ -220,102 +618,483 @@ class LngParser:
             self.vend = words[3] if len(words) > 3 else self.vend
             self.comment = words[4] if len(words) > 4 else self.comment
             
-            self.log(f"INFO: settings updated - vb='{self.vb}', "
-                    f"vbegin='{self.vbegin}', vend='{self.vend}', "
-                    f"comment='{self.comment}'")
+            self._report(INFO, "settings_updated", n_line, "", self.vb, self.vbegin, self.vend, self.comment)
         elif len(words) > 1:  # There are some settings, but not all
-            self.log(f"WARNING: incomplete settings line, expected 5 words, got {len(words)}")
+            self._report(WARNING, "incomplete_settings", n_line, "", len(words))
             
     
     def _resolve_all_references(self) -> Dict[str, str]:
         """Resolves all references and returns the final dictionary"""
-        resolved = {}
-        self.log("== 2 == Second pass: recursive substitutions...")
+        self._report(DEBUG, "pass2")
+        self._tokens = {}
+        self._resolved = {}
+        self._failed = set()
+        self._expanded_total = 0
+        self._added = {}
+        self._resolve_names(self.blocks)
+        resolved = self._resolved
+        ret = {}
+        for block_name in self.blocks:
+            value = resolved[block_name]
+            ret[block_name] = value.text() if value.__class__ is _Rope else value
+        return ret
 
-        for block_name, (content, settings) in self.blocks.items():
-            resolved[block_name] = self._resolve_block(content, block_name, settings)
-        
-        return resolved
+
+    def _value(self, block_name: str) -> str:
+        """Text of an already resolved block"""
+        value = self._resolved[block_name]
+        return value.text() if value.__class__ is _Rope else value
+
+
+    def _resolve_names(self, roots):
+        """Resolves the given blocks and all the blocks they depend on.
+        Each block is resolved only once, after the blocks it uses.
+        Circular references are found by Tarjan's algorithm (strongly connected
+        components) with an explicit stack, so the depth of reference chains
+        is not limited by the Python stack"""
+        index: Dict[str, int] = {}  # order of visiting blocks
+        low: Dict[str, int] = {}    # smallest index reachable from a block
+        stack: List[str] = []       # blocks of components not yet completed
+        on_stack = set()
+        start = time.perf_counter()
+        blocks = self.blocks
+        resolved = self._resolved
+        resolve_plain = self._resolve_plain
+
+        for root in roots:
+            if root in resolved or root in index:
+                continue
+            content, settings = blocks[root]
+            if settings.vbegin not in content:
+                resolve_plain(root, content)
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self._block_dependencies(root)))]
+            while work:
+                block_name, deps = work[-1]
+                for dep in deps:
+                    if dep in resolved:
+                        continue
+                    if dep not in index:
+                        content, settings = blocks[dep]
+                        if settings.vbegin not in content:
+                            resolve_plain(dep, content)
+                            continue
+                        # we go deeper, the rest of the dependencies will be later
+                        index[dep] = low[dep] = len(index)
+                        stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, iter(self._block_dependencies(dep))))
+                        break
+                    if dep in on_stack:
+                        low[block_name] = min(low[block_name], index[dep])
+                else:
+                    # all dependencies of the block are processed
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[block_name])
+                    if low[block_name] == index[block_name]:
+                        component = []
+                        while True:
+                            name = stack.pop()
+                            on_stack.discard(name)
+                            component.append(name)
+                            if name == block_name:
+                                break
+                        self._resolve_component(component)
+
+        stats = self.stats
+        stats.time_pass2 += time.perf_counter() - start
+        stats.errors = self.errors
+        stats.warnings = self.warnings
+
+
+    def _resolve_component(self, component: List[str]):
+        """Resolves a group of blocks whose dependencies are already resolved.
+        More than one block in a group means circular references: they are
+        reported, and references inside the circle remain as is"""
+        cycle = frozenset(component) if len(component) > 1 else frozenset()
+        if cycle:
+            component.sort(key=lambda name: self.block_lines.get(name, 0))
+            self._report(ERROR, "cycle", self.block_lines.get(component[0], 0), "",
+                         tuple((name, self.block_lines.get(name, 0)) for name in component))
+        for block_name in component:
+            errors = self.errors
+            self._resolved[block_name] = self._resolve_block(block_name, cycle)
+            # the segments are no longer needed
+            self._tokens.pop(block_name, None)
+            # a block with errors (its own or in the blocks it uses) is considered failed
+            if cycle or self.errors > errors:
+                self._failed.add(block_name)
+
+
+    def _resolve_plain(self, block_name: str, content: str):
+        """Fast path for a block without references (the common case): its text is
+        its value, nothing to tokenize. Nothing is expanded, so no limit applies"""
+        size = len(content)
+        self._resolved[block_name] = content
+        self._tokens.pop(block_name, None)
+        stats = self.stats
+        stats.expanded_size += size
+        if size > stats.peak_resolved_size:
+            stats.peak_resolved_size = size
+
+
+    def _block_tokens(self, block_name: str) -> list:
+        """Block text split into segments (tokenized once per block)"""
+        tokens = self._tokens.get(block_name)
+        if tokens is None:
+            content, settings = self.blocks[block_name]
+            tokens = self._tokens[block_name] = tokenize_block(content, settings)
+        return tokens
+
+
+    def _block_dependencies(self, block_name: str) -> List[str]:
+        """Names of other existing blocks that the block refers to"""
+        deps = {}  # dict keeps the order of the references
+        for token in self._block_tokens(block_name):
+            if token.__class__ is Reference and token.name != block_name and token.name in self.blocks:
+                deps[token.name] = None
+        return list(deps)
+
+
+    def _resolve_name(self, block_name: str) -> str:
+        """Resolved value of the block (computed once and remembered)"""
+        if block_name not in self._resolved:
+            self._resolve_names((block_name,))
+        return self._value(block_name)
     
 
-    def _resolve_block(self, content: str, current_block_name: str, settings: BlockSettings) -> str:
-        """Allows all links in one block, taking into account its settings"""
-        vbegin_escaped = re.escape(settings.vbegin)
-        vend_escaped = re.escape(settings.vend)
-        pattern = f'{vbegin_escaped}(.+?){vend_escaped}'
-        
+    def _resolve_block(self, current_block_name: str, cycle: frozenset = frozenset()):
+        """Allows all links in one block, taking into account its settings.
+        References to the blocks of 'cycle' (circular references) are not substituted.
+        Returns a string, or '_Rope' if other blocks were substituted"""
         # Cache for aliases in this block
         aliases_cache = {}
+        parts = []
+        references = 0
+        alias_hits = 0
+        size = 0
+        depth = 0
         
-        # Function for bat link
-        def replace_match(match):
-            full_match = match.group(0)
-            inner = match.group(1).strip()
-            
-            if not inner:
-                return full_match
+        for token in self._block_tokens(current_block_name):
+            if token.__class__ is str:
+                parts.append(token)
+                size += len(token)
+                continue
             
-            # Understandable: "var" or "var alias"
-            parts = inner.split()
-            var_name = parts[0]
-            alias = parts[1] if len(parts) > 1 else None
+            var_name = token.name
+            alias = token.alias
             
             # Checking recursion
-            if var_name == current_block_name:
-                return full_match
+            if var_name == current_block_name or var_name in cycle:
+                parts.append(token.text)
+                size += len(token.text)
+                continue
             
             # Looking for a variable
             if var_name in self.blocks:
-                var_content, var_settings = self.blocks[var_name]
-                
-                # Recursively resolve nested references in the found variable
-                # but with her own settings!
-                resolved_var = self._resolve_block(var_content, var_name, var_settings)
+                # The variable is already resolved with her own settings
+                # (blocks are resolved in dependency order)
+                resolved_var = self._resolved[var_name]
+                if var_name in self._failed:
+                    self._failed.add(current_block_name)
                 
                 # If there is an alias, remember it for this block
                 if alias:
                     if alias in aliases_cache:
-                            self.log(f"WARNING block '{current_block_name}': alias '{alias}' was overwritten. Is this really what you wanted?")     
-                            self.warnings += 1 
+                            self._report(WARNING, "alias_overwritten", self.block_lines.get(current_block_name, 0),
+                                         current_block_name, alias)
                     aliases_cache[alias] = resolved_var
                 
-                return resolved_var
+                parts.append(resolved_var)
+                references += 1
+                if resolved_var.__class__ is _Rope:
+                    size += resolved_var.size
+                    depth = max(depth, resolved_var.depth + 1)
+                else:
+                    size += len(resolved_var)
+                    depth = max(depth, 1)
+                continue
             
 
             # Let's check if it's an alias from the cache.          
             if var_name in aliases_cache:
                 if alias is not None:
-                    self.log(f"ERROR block '{current_block_name}', substitution '{inner}': It is not allowed to create an alias for an alias!")     
-                    self.errors += 1
-                return aliases_cache[var_name]
+                    self._report(ERROR, "alias_of_alias", self.block_lines.get(current_block_name, 0),
+                                 current_block_name, token.inner)
+                value = aliases_cache[var_name]
+                parts.append(value)
+                alias_hits += 1
+                size += value.size if value.__class__ is _Rope else len(value)
             else:                
-                self.log(f"ERROR block '{current_block_name}', substitution '{var_name}' was not found! ('{inner}')")   
-                self.errors += 1
-            
-            return full_match
+                self._report(ERROR, "not_found", self.block_lines.get(current_block_name, 0),
+                             current_block_name, var_name, token.inner)
+                parts.append(token.text)
+                size += len(token.text)
         
-        
-        # Replace links (maximum 10 iterations for complex cases)
-        result = content        
-        for _ in range(10):
-            new_result = re.sub(pattern, replace_match, result)
-            if new_result == result:
-                break
-            result = new_result                      
+        stats = self.stats
+        stats.references += references
+        stats.alias_hits += alias_hits
+        source = self.blocks[current_block_name][0]
+        added = size - len(source)  # what the references add to the text of the block
+        if not self._within_limits(current_block_name, size, added, depth):
+            self._failed.add(current_block_name)
+            return source
+        if added > 0:
+            self._expanded_total += added
+            self._added[current_block_name] = added
+        stats.expanded_size += size
+        if size > stats.peak_resolved_size:
+            stats.peak_resolved_size = size
+        if depth == 0:
+            return "".join(parts)
+        return _Rope(tuple(parts), size, depth)
 
-        
-        return result
+
+    def _within_limits(self, block_name: str, size: int, added: int, depth: int) -> bool:
+        """Checks the expanded size and the nesting of a value against the limits
+        (an error is reported if they are exceeded). 'added' -characters the
+        references add to the text of the block, the sizes are checked only if > 0"""
+        line = self.block_lines.get(block_name, 0)
+        if self.max_depth is not None and depth > self.max_depth:
+            self._report(ERROR, "depth_limit", line, block_name, depth, self.max_depth)
+            return False
+        if added <= 0:
+            return True
+        if self.max_expanded_size is not None and size > self.max_expanded_size:
+            self._report(ERROR, "expansion_limit", line, block_name, size, self.max_expanded_size)
+            return False
+        if self.max_total_size is not None and self._expanded_total + added > self.max_total_size:
+            self._report(ERROR, "total_limit", line, block_name, self.max_total_size)
+            return False
+        return True
+
+
+class LazyTranslations(Mapping):
+    """Read-only key->value dictionary that resolves a block only when it is
+    requested for the first time (and then remembers it).
+    Keys whose resolution gave errors behave as missing: also for 'in', iteration
+    and len(). So 'in' resolves the key, and iteration and len() resolve all
+    the keys (once); 'block_count' is the number of blocks without resolving them"""
+
+    def __init__(self, parser: LngParser):
+        self._parser = parser
+        self._ready: Dict[str, str] = {}  # already resolved keys without errors
+        self._lock = threading.Lock()
+        self._complete = False  # all the keys are resolved
+
+    def __getitem__(self, key: str) -> str:
+        value = self._ready.get(key)
+        if value is None:
+            value = self._resolve(key)
+            if value is None:
+                raise KeyError(key)
+        return value
+
+    def get(self, key: str, default=None):
+        value = self._ready.get(key)
+        if value is None:
+            value = self._resolve(key)
+            if value is None:
+                return default
+        return value
+
+    def _resolve(self, key: str) -> Optional[str]:
+        """Resolves the key (and the blocks it uses). None if there is no key or it has errors"""
+        parser = self._parser
+        if key not in parser.blocks:
+            return None
+        with self._lock:
+            value = parser._resolve_name(key)
+            if key in parser._failed:
+                return None
+            self._ready[key] = value
+        return value
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self.get(key) is not None
+
+    def __iter__(self):
+        """Keys without errors in the order of the file (all of them are resolved first)"""
+        self.validate()
+        failed = self._parser._failed
+        return iter([key for key in self._parser.blocks if key not in failed])
+
+    def __len__(self) -> int:
+        self.validate()
+        parser = self._parser
+        return len(parser.blocks) - len(parser._failed.intersection(parser.blocks))
+
+    @property
+    def block_count(self) -> int:
+        """Number of blocks read, also the ones not resolved yet (that may still fail)"""
+        return len(self._parser.blocks)
+
+    @property
+    def errors(self) -> int:
+        """Errors found so far (only in the keys already requested, until 'validate')"""
+        return self._parser.errors
+
+    @property
+    def warnings(self) -> int:
+        return self._parser.warnings
+
+    @property
+    def diagnostics(self) -> Diagnostics:
+        """Messages of parsing, for lazy resolution they are added as the keys are requested"""
+        return self._parser.diagnostics
+
+    def validate(self) -> int:
+        """Resolves all the keys that have not yet been requested and returns the number of errors"""
+        if not self._complete:
+            with self._lock:
+                self._parser._resolve_names(self._parser.blocks)
+                self._complete = True
+        return self._parser.errors
 
 
-def load_lng(filepath: str, logging_to_screen : bool = False) -> Dict[str, str]:
-    """Loads a .lng file and returns a translation dictionary"""
+def _file_digest(filepath: str) -> str:
+    """SHA-1 of the file content (read in chunks)"""
+    import hashlib
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_cache_path(filepath: str, cache_dir: Optional[str] = None) -> str:
+    """Path of the compiled cache for a .lng file.
+    By default the cache lies in the '__lngcache__' folder next to the file"""
+    import hashlib
+    filepath = os.path.abspath(filepath)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filepath), CACHE_DIR_NAME)
+    # the path hash allows one cache folder for files with the same name
+    path_hash = hashlib.sha1(filepath.encode('utf-8')).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(cache_dir, f"{name}-{path_hash}.lngcache")
+
+
+def _cache_key(filepath: str, st: os.stat_result, digest: str,
+               limits: tuple = (MAX_EXPANDED_SIZE, MAX_DEPTH, MAX_TOTAL_SIZE)) -> tuple:
+    """Everything the validity of the cache depends on
+    ('limits' -the limits of expansion the table was parsed with)"""
+    return (CACHE_MAGIC, PARSER_VERSION, os.path.abspath(filepath),
+            st.st_size, st.st_mtime_ns, digest, tuple(limits))
+
+
+def _read_cache(cache_path: str, key: tuple) -> Optional[Dict[str, str]]:
+    """Returns the cached dictionary or None if there is no valid cache"""
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, table = marshal.loads(f.read())
+    except Exception:  # no file, damaged file or another marshal version
+        return None
+    if cached_key != key or not isinstance(table, dict):
+        return None
+    return table
+
+
+def write_file_atomic(path: str, data):
+    """Writes 'data' (bytes, or str as UTF-8) via a temporary file that then
+    replaces the file, so a reader never sees a half-written file.
+    Raises OSError (the temporary file is removed then)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_cache(cache_path: str, key: tuple, table: Dict[str, str]) -> bool:
+    """Writes the cache atomically.
+    Returns False if it could not be written (for example, a read-only folder)"""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        write_file_atomic(cache_path, marshal.dumps((key, table)))
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def read_cached(filepath: str, cache_dir: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """The resolved dictionary from the compiled cache (made with the default limits),
+    without parsing. None if there is no cache or it is no longer valid"""
+    try:
+        key = _cache_key(filepath, os.stat(filepath), _file_digest(filepath))
+    except OSError:
+        return None
+    return _read_cache(get_cache_path(filepath, cache_dir), key)
+
+
+def load_lng(filepath: str, logging_to_screen : bool = False,
+             use_cache: bool = False, cache_dir: Optional[str] = None,
+             lazy: bool = False, stats: Optional[ParseStats] = None,
+             diagnostics: Optional[Diagnostics] = None,
+             max_expanded_size: Optional[int] = MAX_EXPANDED_SIZE,
+             max_depth: Optional[int] = MAX_DEPTH,
+             max_total_size: Optional[int] = MAX_TOTAL_SIZE) -> Mapping:
+    """Loads a .lng file and returns a translation dictionary.
+    With 'use_cache' the already resolved dictionary is saved in a compiled cache
+    and next time it is loaded from there, as long as the file has not changed
+    (size, modification time and content hash are checked) and the limits are the same.
+    With 'lazy' (and without a valid cache) only the first pass is done and
+    'LazyTranslations' is returned: the values are resolved on the first request.
+    If 'stats' is given, it is filled with timings and counters of the load,
+    and 'diagnostics' collects the messages of parsing.
+    'max_expanded_size', 'max_depth', 'max_total_size' -limits of expanding
+    references (None -no limit), a value over a limit is an error"""
+    if stats is None:
+        stats = ParseStats()
+    key = None
+    if use_cache:
+        start = time.perf_counter()
+        try:
+            st = os.stat(filepath)
+            key = _cache_key(filepath, st, _file_digest(filepath),
+                             (max_expanded_size, max_depth, max_total_size))
+        except OSError:
+            key = None  # the parser itself will report the missing file
+        if key is not None:
+            cache_path = get_cache_path(filepath, cache_dir)
+            table = _read_cache(cache_path, key)
+            if table is not None:
+                stats.reset()
+                stats.path = filepath
+                stats.source = "cache"
+                stats.time_read = time.perf_counter() - start
+                stats.blocks = len(table)
+                return table
+
     parser = LngParser()
     parser.logging_to_screen = logging_to_screen
+    parser.stats = stats
+    parser.max_expanded_size = max_expanded_size
+    parser.max_depth = max_depth
+    parser.max_total_size = max_total_size
+    if diagnostics is not None:
+        parser.diagnostics = diagnostics
+    if lazy:
+        # there are no errors in the first pass, except for a missing file
+        if not parser.read_file(filepath) or parser.errors > 0:
+            return {}
+        return LazyTranslations(parser)
     ret = parser.parse_file(filepath)
     if parser.errors > 0:     
         return {}
-    else:
-        return ret
+    if key is not None:
+        _write_cache(cache_path, key, ret)
+    return ret
 
 
 # Testing (if called as a program and not a module)
@@ -323,11 +1102,23 @@ if __name__ == "__main__":
     # Checking if there are command line arguments
     if len(sys.argv) > 1:
         # There are arguments -we process the file
-        filename = sys.argv[1]        
+        # ("--json" -machine-readable result: stats and all diagnostics)
+        as_json = "--json" in sys.argv[1:]
+        filename = [arg for arg in sys.argv[1:] if arg != "--json"][0]
         # Checking the existence of the file
         if not os.path.exists(filename):
             print(f"Error: file '{filename}' not found")
             sys.exit(1)        
+        if as_json:
+            import json
+            stats = ParseStats()
+            diagnostics = Diagnostics(level=INFO)
+            result = load_lng(filename, stats=stats, diagnostics=diagnostics)
+            print(json.dumps({"file": filename, "translations": len(result),
+                              "errors": stats.errors, "warnings": stats.warnings,
+                              "stats": stats.as_dict(), "diagnostics": diagnostics.as_dicts()},
+                             ensure_ascii=False, indent=1))
+            sys.exit(1 if stats.errors else 0)
         # Checking the extension
         if not filename.lower().endswith('.lng'):
             print(f"Warning: file '{filename}' does not have a .lng extension")        
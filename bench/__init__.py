@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" benchmarks of the localization module
+
+Run from the folder that contains the localization folder, for example:
+    python -m localization.bench --profile realistic --json results.json
+    python -m localization.bench --compare results.json
+Generate a test file only:
+    python -m localization.bench.corpus realistic out.lng
+"""
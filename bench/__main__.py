@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" timing and memory benchmarks (see bench/__init__.py for how to run) """
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from .. import adv_settings, compact, lang, lngpy
+from . import corpus
+
+RESULTS_FORMAT = 1
+DEFAULT_PROFILES = ["small", "realistic", "long_texts", "deep", "switches"]
+BENCH_LANGUAGE = "zz_BENCH"  # temporary pack in the folder of lang.py
+RETAINED_RUNS = 3  # runs of each table in 'bench_memory' (the median is reported)
+
+
+def measure(func: Callable, setup: Optional[Callable] = None, repeat: int = 5,
+            memory: bool = True) -> Dict:
+    """Runs 'func(setup())' several times. Returns times in seconds and the
+    peak of allocated memory (tracemalloc, measured in a separate run)"""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    result = {
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+    }
+    if memory:
+        arg = setup() if setup else None
+        gc.collect()
+        tracemalloc.start()
+        func(arg)
+        result["peak_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return result
+
+
+def _quiet_parser() -> adv_settings.LngParser:
+    parser = adv_settings.LngParser()
+    parser.logging_to_screen = False
+    return parser
+
+
+def bench_parser(path: str, repeat: int) -> Dict[str, Dict]:
+    """Benchmarks of adv_settings on one file"""
+    results = {}
+    results["parse_file"] = measure(lambda _: _quiet_parser().parse_file(path), repeat=repeat)
+
+    def first_pass(_):
+        parser = _quiet_parser()
+        parser.read_file(path)
+        return parser
+    results["first_pass"] = measure(first_pass, repeat=repeat)
+    # the second pass alone, on a parser that has already read the file
+    results["resolve_all_references"] = measure(lambda parser: parser._resolve_all_references(),
+                                                setup=lambda: first_pass(None), repeat=repeat)
+    results["load_lng"] = measure(lambda _: adv_settings.load_lng(path), repeat=repeat)
+
+    cache_dir = tempfile.mkdtemp(prefix="lngbench")
+    try:
+        adv_settings.load_lng(path, use_cache=True, cache_dir=cache_dir)  # fill the cache
+        results["load_lng_cached"] = measure(
+            lambda _: adv_settings.load_lng(path, use_cache=True, cache_dir=cache_dir), repeat=repeat)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def bench_lang(path: str, repeat: int) -> Dict[str, Dict]:
+    """Benchmarks of lang.set_lang and lang.q (the file is copied next to lang.py)"""
+    lang_dir = os.path.dirname(os.path.abspath(lang.__file__))
+    pack_path = os.path.join(lang_dir, f"{BENCH_LANGUAGE}.lng")
+    shutil.copyfile(path, pack_path)
+    results = {}
+    try:
+        # without a valid compiled cache every time
+        def set_lang_cold(_):
+            cache_path = adv_settings.get_cache_path(pack_path)
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            lang.set_lang(BENCH_LANGUAGE)
+
+        def set_lang(_):
+            lang.set_lang(BENCH_LANGUAGE)
+        # 'lang.evict' -not from the memory cache of recent languages
+        results["set_lang"] = measure(set_lang_cold, setup=lang.evict, repeat=repeat)
+        lang.set_lang(BENCH_LANGUAGE)
+        results["set_lang_cached"] = measure(set_lang, setup=lang.evict, repeat=repeat)
+        # from the compiled module (its .pyc is written by the first load)
+        lngpy.compile_module(pack_path)
+        lang.evict()
+        lang.set_lang(BENCH_LANGUAGE)
+        results["set_lang_module"] = measure(set_lang, setup=lang.evict, repeat=repeat)
+        os.remove(lngpy.get_module_path(pack_path))
+        # switching back to a language still in the memory cache
+        lang.evict()
+        lang.set_lang(BENCH_LANGUAGE)
+        results["set_lang_memory"] = measure(set_lang, repeat=repeat)
+
+        keys = list(adv_settings.load_lng(pack_path))
+        q = lang.q
+
+        def lookups(_):
+            for key in keys:
+                q(key)
+        results["q"] = measure(lookups, repeat=repeat, memory=False)
+        results["q"]["lookups"] = len(keys)
+    finally:
+        lang.evict([BENCH_LANGUAGE])
+        cache_path = adv_settings.get_cache_path(pack_path)
+        module_path = lngpy.get_module_path(pack_path)
+        for name in (pack_path, cache_path, module_path, importlib.util.cache_from_source(module_path)):
+            if os.path.exists(name):
+                os.remove(name)
+        try:
+            os.rmdir(os.path.dirname(cache_path))  # only if we created it and it is empty
+        except OSError:
+            pass
+    return results
+
+
+def _retained(func: Callable):
+    """Returns (result of 'func()', bytes still allocated by it afterwards)"""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, retained
+
+
+def bench_memory(path: str, repeat: int) -> Dict[str, Dict]:
+    """Resident size and lookup time of a loaded table: plain dict against CompactTable"""
+    results = {}
+    tables = {
+        "dict": lambda: adv_settings.load_lng(path),
+        "compact": lambda: compact.CompactTable(adv_settings.load_lng(path)),
+    }
+    # one discarded run of each first: caches of the modules grow once and would
+    # otherwise be counted for whichever table is measured first. Then the median
+    # of a few runs: the dictionary of interned strings (shared by the whole
+    # process) is resized now and then, inside the run of one of the tables
+    for load in tables.values():
+        _retained(load)
+    for name, load in tables.items():
+        samples = []
+        for _ in range(RETAINED_RUNS):
+            table, retained = _retained(load)
+            samples.append(retained)
+            if len(samples) < RETAINED_RUNS:
+                del table
+        retained = int(statistics.median(samples))
+        keys = list(table)
+        get = table.get
+
+        def lookups(_):
+            for key in keys:
+                get(key)
+        result = measure(lookups, repeat=repeat, memory=False)
+        result["lookups"] = len(keys)
+        result["retained_kib"] = retained // 1024
+        results[f"table_{name}"] = result
+        del table, get, keys, lookups  # not alive while the next one is measured
+    return results
+
+
+_IMPORT_CODE = """
+import sys, time
+for name in {preload!r}:
+    __import__(name)
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(int('aqt' in sys.modules))
+"""
+
+
+def _import_time(module: str, preload: List[str], repeat: int) -> Dict:
+    """Time of importing a module in a fresh interpreter (after importing 'preload')"""
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(package_dir))
+    code = _IMPORT_CODE.format(module=module, preload=preload)
+    times = []
+    aqt_loaded = False
+    for _ in range(repeat + 1):  # the first run only fills __pycache__
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True,
+                             text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+        aqt_loaded = out[1] == "1"
+    times = times[1:]
+    return {"repeat": repeat, "min": min(times), "median": statistics.median(times),
+            "mean": statistics.fmean(times), "aqt_loaded": aqt_loaded}
+
+
+def bench_import(repeat: int) -> Dict[str, Dict]:
+    """Import time of the modules: without Anki, and with Anki already loaded
+    (the usual case inside an add-on, measured only if aqt is installed)"""
+    package = __package__.rpartition(".")[0]
+    results = {
+        "adv_settings": _import_time(f"{package}.adv_settings", [], repeat),
+        "lang_headless": _import_time(f"{package}.lang", [], repeat),
+    }
+    if importlib.util.find_spec("aqt") is not None:
+        results["lang_with_aqt"] = _import_time(f"{package}.lang", ["aqt"], repeat)
+    return results
+
+
+def run(profiles: List[str], repeat: int, seed: int) -> Dict:
+    """Runs all benchmarks and returns the results in machine-readable form"""
+    results: Dict[str, Dict] = {}
+    for name, result in bench_import(repeat).items():
+        results[f"import/{name}"] = result
+        print(f"{'import/' + name:40} median {result['median'] * 1000:10.3f} ms", file=sys.stderr)
+    work_dir = tempfile.mkdtemp(prefix="lngbench")
+    try:
+        for profile in profiles:
+            path = corpus.write_profile(profile, os.path.join(work_dir, f"{profile}.lng"), seed=seed)
+            file_info = {"bytes": os.path.getsize(path), "blocks": corpus.PROFILES[profile]["blocks"]}
+            for group in (bench_parser(path, repeat), bench_lang(path, repeat), bench_memory(path, repeat)):
+                for name, result in group.items():
+                    results[f"{profile}/{name}"] = dict(result, file=file_info)
+                    print(f"{profile + '/' + name:40} median {result['median'] * 1000:10.3f} ms"
+                          + (f"  peak {result['peak_kib']:8d} KiB" if "peak_kib" in result else "")
+                          + (f"  retained {result['retained_kib']:8d} KiB" if "retained_kib" in result else ""),
+                          file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "format": RESULTS_FORMAT,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parser_version": adv_settings.PARSER_VERSION,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(old: Dict, new: Dict, threshold: float) -> int:
+    """Prints the ratio of the medians, returns the number of regressions"""
+    regressions = 0
+    print(f"{'benchmark':40} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if not before:
+            continue
+        ratio = result["median"] / before["median"] if before["median"] else float("inf")
+        mark = ""
+        if ratio > threshold:
+            mark = "  SLOWER"
+            regressions += 1
+        print(f"{name:40} {before['median'] * 1000:10.3f} {result['median'] * 1000:10.3f} {ratio:7.2f}{mark}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench", description="Benchmarks of the .lng parser and lang.py")
+    parser.add_argument("--profile", action="append", choices=sorted(corpus.PROFILES),
+                        help="file profile (can be repeated), default: " + ", ".join(DEFAULT_PROFILES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="FILE", help="write the results to a JSON file ('-' for stdout)")
+    parser.add_argument("--compare", metavar="FILE", help="compare with earlier results")
+    parser.add_argument("--threshold", type=float, default=1.10,
+                        help="ratio of medians that counts as a regression (default 1.10)")
+    args = parser.parse_args(argv)
+
+    data = run(args.profile or DEFAULT_PROFILES, args.repeat, args.seed)
+    if args.json == "-":
+        json.dump(data, sys.stdout, indent=1)
+        print()
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        return 1 if compare(old, data, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
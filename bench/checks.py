@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" equivalence checks of the faster code paths against the plain ones
+
+Run from the folder that contains the localization folder:
+    python -m localization.bench.checks [--rounds 300] [--seed 0]
+Exits with 1 if any check fails (the first differences are printed).
+"""
+
+# Randomized, but reproducible with '--seed':
+#   incremental -random edits of a file: IncrementalLngParser.update must give
+#                 the same values, failed blocks and errors of the resolved blocks
+#                 as parse_file of the new text (with the total limit set to exactly
+#                 the total of parse_file, so a miscounted total shows up at once)
+#   lazy        -LazyTranslations: 'in', iteration, len() and get agree with parse_file
+#   fallbacks   -lang.set_lang and preload with a fallback chain, lazy or not
+#   cycles      -random reference graphs: the reported circular references must be
+#                 exactly the strongly connected components (found here by brute force)
+#   limits      -a pack without references loads whatever its size; the same pack
+#                 with references gets 'total_limit' exactly where the added text
+#                 goes over the limit (small limits stand for the default ones)
+#   negotiation -lang.normalize_locale and negotiate_lang on a table of locales
+#                 (script/region fallback), each written in random spellings
+#   lngc        -random tables written to .lngc and read back: the same mapping
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set
+
+from .. import adv_settings, incremental, lang, lngc
+from . import corpus
+
+# A small file with everything the edits can break: settings switches, multi-name
+# blocks, aliases, a cycle, a missing reference, an empty block
+_SEED_TEXT = """!!! === $ $ ; checked file
+=== title ; comment
+Title of $app$
+=== app app_name
+Anki
+=== ok
+OK $app alias$ and $alias$
+=== loop_a
+A $loop_b$
+=== loop_b
+B $loop_a$
+=== broken
+uses $nothing$
+===
+!!! *** { } %
+*** curly % other settings
+{title} and {ok}
+***
+!!! === $ $ ;
+=== tail
+$curly$ $title$
+"""
+
+
+def _full_parse(text: str, folder: str) -> adv_settings.LngParser:
+    path = os.path.join(folder, "full.lng")
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    parser = adv_settings.LngParser()
+    parser.logging_to_screen = False
+    parser.max_total_size = None
+    parser.parse_file(path)
+    return parser
+
+
+# diagnostics of the second pass, they are reported for the block being resolved
+_RESOLVE_CODES = {"not_found", "alias_of_alias", "alias_overwritten",
+                  "expansion_limit", "depth_limit", "total_limit"}
+
+
+def _resolve_errors(parser: adv_settings.LngParser, names) -> Counter:
+    """(block, code) of the second-pass diagnostics of the given blocks"""
+    names = set(names)
+    return Counter((record.block, record.code) for record in parser.diagnostics.records
+                   if record.code in _RESOLVE_CODES and record.block in names)
+
+
+def _random_line(rnd: random.Random, names: List[str]) -> str:
+    name = rnd.choice(names)
+    kind = rnd.randrange(8)
+    if kind == 0:
+        return f"=== {name}" + (f" {rnd.choice(names)}" if rnd.random() < 0.2 else "")
+    if kind == 1:
+        return f"=== new_{rnd.randrange(20)} ; added"
+    if kind == 2:
+        return rnd.choice(("!!! *** { } %", "!!! === $ $ ;", "!!! ===", "==="))
+    if kind == 3:
+        return f"*** {name} % block with other settings"
+    if kind == 4:
+        return f"text with ${name}$ and {{{rnd.choice(names)}}}"
+    if kind == 5:
+        return f"alias ${name} al$ then $al$"
+    if kind == 6:
+        return ""
+    return " ".join(rnd.choice(("word", "$", "{", "}", ";", "%", name)) for _ in range(rnd.randrange(1, 5)))
+
+
+_NAMES = ["title", "app", "app_name", "ok", "loop_a", "loop_b", "broken", "curly",
+          "tail", "alias", "nothing", "q_1", "q_2", "q_5", "q_17"]
+
+
+def _initial_lines(rnd: random.Random) -> List[str]:
+    generated = corpus.generate_lng(blocks=60, lines=2, words=4, refs=1.0, depth=3,
+                                    aliases=0.2, switch_every=15, seed=rnd.randrange(1 << 30))
+    return (_SEED_TEXT + "\n".join(generated.split("\n")[1:])).split("\n")
+
+
+def _edit_lines(rnd: random.Random, lines: List[str]):
+    """A few random edits of the lines (in place)"""
+    for _ in range(rnd.randrange(1, 4)):
+        i = rnd.randrange(1, len(lines) + 1)  # the first (settings) line stays
+        op = rnd.randrange(4)
+        if op == 0 and len(lines) > 2:
+            del lines[min(i, len(lines) - 1)]
+        elif op == 1:
+            lines.insert(i, _random_line(rnd, _NAMES))
+        elif op == 2 and i < len(lines):
+            lines[i] = _random_line(rnd, _NAMES)
+        else:
+            j = rnd.randrange(1, len(lines))
+            lines[i:i] = lines[j:j + rnd.randrange(1, 6)]  # a copied piece
+
+
+def check_incremental(rnd: random.Random, rounds: int, folder: str) -> List[str]:
+    """Random edits applied one after another to one incremental parser"""
+    problems = []
+    lines = _initial_lines(rnd)
+    parser = incremental.IncrementalLngParser()
+    parser.logging_to_screen = False
+    parser.update("\n".join(lines))
+    for n in range(rounds):
+        _edit_lines(rnd, lines)
+        text = "\n".join(lines)
+        full = _full_parse(text, folder)
+        parser.max_total_size = full._expanded_total
+        parser.diagnostics = adv_settings.Diagnostics()
+        update = parser.update(text)
+        expected = {name: full._value(name) for name in full.blocks}
+        errors = _resolve_errors(parser, update.changed)
+        expected_errors = _resolve_errors(full, update.changed)
+        if (parser.translations != expected or parser._failed != full._failed
+                or errors != expected_errors):
+            diff = sorted(key for key in set(expected) | set(parser.translations)
+                          if expected.get(key) != parser.translations.get(key))
+            problems.append(f"round {n}: lines {update.first_line}-{update.last_line}, "
+                            f"different values: {diff[:5]}, "
+                            f"failed {sorted(parser._failed ^ full._failed)[:5]}, "
+                            f"errors {sorted((errors - expected_errors) + (expected_errors - errors))[:5]}")
+            # continue from a correct state
+            parser = incremental.IncrementalLngParser()
+            parser.logging_to_screen = False
+            parser.update(text)
+        if len(problems) >= 5:
+            break
+    return problems
+
+
+def check_lazy(rnd: random.Random, rounds: int, folder: str) -> List[str]:
+    """LazyTranslations against parse_file: the keys with errors are missing for
+    get, 'in', iteration and len(), in whatever order the keys are requested"""
+    problems = []
+    lines = _initial_lines(rnd)
+    path = os.path.join(folder, "lazy.lng")
+    for n in range(max(1, rounds // 3)):
+        _edit_lines(rnd, lines)
+        full = _full_parse("\n".join(lines), folder)
+        expected = {name: full._value(name) for name in full.blocks if name not in full._failed}
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write("\n".join(lines))
+        table = adv_settings.load_lng(path, lazy=True)
+        probe = list(full.blocks) + ["nothing", "al"]
+        rnd.shuffle(probe)
+        got = {}
+        for key in probe[:len(probe) // 2]:  # some keys first, one by one
+            if (key in table) != (key in expected) or table.get(key) != expected.get(key):
+                problems.append(f"round {n}: key '{key}' differs")
+                break
+        try:
+            got = dict(table)
+        except KeyError as e:
+            problems.append(f"round {n}: iteration gave a key without value: {e}")
+        if not problems and (got != expected or len(table) != len(expected) or list(table) != list(expected)):
+            problems.append(f"round {n}: iteration or len() differs from parse_file")
+        if problems:
+            break
+    return problems
+
+
+_CHECK_PACKS = {
+    # 'q_bad' has an error: with a fallback chain it is taken from the fallback
+    "zz_CHECK_A": "!!! === $ $ ;\n=== q_ok\nA ok\n=== q_bad\nA $nope$\n=== q_uses_bad\n$q_bad$ too\n",
+    "zz_CHECK_B": "!!! === $ $ ;\n=== q_ok\nB ok\n=== q_bad\nB bad\n=== q_only_b\nB only\n",
+}
+
+
+def check_fallbacks(rnd: random.Random, rounds: int, folder: str) -> List[str]:
+    """set_lang and preload with a fallback chain, also for lazy tables with errors
+    (packs are written next to lang.py for the time of the check)"""
+    problems = []
+    expected = {"q_ok": "A ok", "q_bad": "B bad", "q_uses_bad": "", "q_only_b": "B only"}
+    lang_dir = os.path.dirname(os.path.abspath(lang.__file__))
+    paths = [os.path.join(lang_dir, f"{code}.lng") for code in _CHECK_PACKS]
+    old_language, old_chain = lang.get_lang(), lang.get_fallback_chain()
+    try:
+        for path, code in zip(paths, _CHECK_PACKS):
+            with open(path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(_CHECK_PACKS[code])
+        lang.set_fallback_chain(["zz_CHECK_B"])
+        for lazy in (True, False):
+            lang.evict()
+            try:
+                lang.preload(["zz_CHECK_A"], lazy=lazy)
+                loaded = lang.set_lang("zz_CHECK_A", lazy=lazy)
+            except Exception as e:
+                problems.append(f"lazy={lazy}: {e!r}")
+                continue
+            if lazy:
+                got = {key: lang.q(key) for key in expected}
+                if not loaded or got != expected:
+                    problems.append(f"lazy={lazy}: {got}")
+            elif loaded:
+                problems.append(f"lazy={lazy}: a pack with errors was loaded")
+    finally:
+        lang.evict(list(_CHECK_PACKS))
+        lang.set_fallback_chain(old_chain)
+        for path in paths:
+            for name in (path, adv_settings.get_cache_path(path)):
+                if os.path.exists(name):
+                    os.remove(name)
+        lang.set_lang(old_language)
+    return problems
+
+
+def _components(graph: Dict[str, Set[str]]) -> Set[frozenset]:
+    """Circular groups of the graph: blocks that reach each other (brute force)"""
+    reach = {}
+    for start in graph:
+        seen = set()
+        work = list(graph[start])
+        while work:
+            name = work.pop()
+            if name not in seen:
+                seen.add(name)
+                work.extend(graph[name])
+        reach[start] = seen
+    groups = set()
+    for name in graph:
+        group = frozenset(other for other in graph if other in reach[name] and name in reach[other])
+        if len(group) > 1:
+            groups.add(group)
+    return groups
+
+
+def check_cycles(rnd: random.Random, rounds: int, folder: str) -> List[str]:
+    """Reported circular references against the components of random graphs"""
+    problems = []
+    for n in range(rounds):
+        count = rnd.randrange(2, 25)
+        names = [f"b{i}" for i in range(count)]
+        graph = {name: {rnd.choice(names) for _ in range(rnd.randrange(0, 3))} for name in names}
+        text = "!!! === $ $ ;\n" + "".join(
+            f"=== {name}\n{name} " + " ".join(f"${ref}$" for ref in sorted(graph[name])) + "\n"
+            for name in names)
+        graph = {name: refs - {name} for name, refs in graph.items()}  # a block may use itself
+        full = _full_parse(text, folder)
+        reported = {frozenset(name for name, _ in record.args[0])
+                    for record in full.diagnostics.records if record.code == "cycle"}
+        expected = _components(graph)
+        if reported != expected:
+            problems.append(f"round {n}: expected {sorted(map(sorted, expected))}, "
+                            f"reported {sorted(map(sorted, reported))}")
+        in_cycles = set().union(*expected) if expected else set()
+        for name in names:
+            # a block fails if it is in a circle or uses (directly or not) one that is
+            uses = {name} | graph[name]
+            work = list(uses)
+            while work:
+                for ref in graph[work.pop()]:
+                    if ref not in uses:
+                        uses.add(ref)
+                        work.append(ref)
+            if (name in full._failed) != bool(uses & in_cycles):
+                problems.append(f"round {n}: block '{name}' failed={name in full._failed}")
+                break
+        if len(problems) >= 5:
+            break
+    return problems
+
+
+def check_limits(rnd: random.Random, rounds: int, folder: str) -> List[str]:
+    """Random packs far bigger than 'max_total_size' and 'max_expanded_size'"""
+    problems = []
+    path = os.path.join(folder, "limits.lng")
+    for n in range(max(1, rounds // 10)):
+        blocks = rnd.randrange(20, 200)
+        limit = rnd.randrange(50, 500)
+        texts = {f"q_{i}": "x" * rnd.randrange(1, 2 * limit) for i in range(blocks)}
+        lines = ["!!! === $ $ ;"]
+        for name, text in texts.items():
+            lines += [f"=== {name}", text]
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write("\n".join(lines) + "\n")
+        diagnostics = adv_settings.Diagnostics()
+        table = adv_settings.load_lng(path, logging_to_screen=False, diagnostics=diagnostics,
+                                      max_expanded_size=limit, max_total_size=limit)
+        if table != texts or diagnostics.records:
+            problems.append(f"round {n}: a pack without references: {len(table)} of {blocks} keys, "
+                            f"{[record.code for record in diagnostics.records][:5]}")
+
+        # the same pack, some blocks also use one block: the blocks whose reference
+        # would make the added text of the pack too long get 'total_limit'
+        users = set(rnd.sample(sorted(texts), rnd.randrange(1, blocks)))
+        ref = "y" * rnd.randrange(10, 60)
+        lines = ["!!! === $ $ ;", "=== ref", ref]
+        for name, text in texts.items():
+            lines += [f"=== {name}", text + (" $ref$" if name in users else "")]
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write("\n".join(lines) + "\n")
+        diagnostics = adv_settings.Diagnostics()
+        adv_settings.load_lng(path, logging_to_screen=False, diagnostics=diagnostics,
+                              max_expanded_size=None, max_total_size=limit)
+        added = 0
+        expected = []
+        for name in texts:  # resolved in the order of the file
+            if name in users:
+                if added + len(ref) - len("$ref$") > limit:
+                    expected.append(name)
+                else:
+                    added += len(ref) - len("$ref$")
+        got = [record.block for record in diagnostics.records if record.code == "total_limit"]
+        if got != expected:
+            problems.append(f"round {n}: total_limit for {got[:5]}, expected {expected[:5]}")
+        if len(problems) >= 5:
+            break
+    return problems
+
+
+_NORMALIZED = [
+    ("pt-br", "pt_BR"), ("zh-hant-tw", "zh_Hant_TW"), ("de_DE.UTF-8@euro", "de_DE"),
+    ("es-419", "es_419"), ("SR_latn_rs", "sr_Latn_RS"), ("C", ""), ("POSIX", ""), ("", ""),
+]
+
+# (requested locales, available files, expected choice)
+_NEGOTIATED = [
+    (["zh_HK"], ["zh_CN", "zh_TW"], "zh_TW"),
+    (["zh_MO"], ["zh_CN", "zh_TW"], "zh_TW"),
+    (["zh_SG"], ["zh_TW", "zh_CN"], "zh_CN"),
+    (["zh_HK"], ["zh_CN", "zh_Hant", "zh_TW"], "zh_Hant"),
+    (["zh_HK"], ["zh_CN", "zh_TW", "zh_HK"], "zh_HK"),
+    (["zh_Hant"], ["zh_CN", "zh_TW"], "zh_TW"),
+    (["zh_Hans"], ["zh_TW", "zh_CN"], "zh_CN"),
+    (["zh_Hant_HK"], ["zh_CN", "zh_TW"], "zh_TW"),
+    (["zh_Hans_SG"], ["zh_TW", "zh_CN"], "zh_CN"),
+    (["zh_CN"], ["zh_TW", "zh_Hans"], "zh_Hans"),
+    (["pt_BR"], ["pt_PT", "pt_BR"], "pt_BR"),
+    (["pt_AO"], ["pt_BR", "pt"], "pt"),
+    (["de"], ["en_US", "de_DE"], "de_DE"),
+    (["de_AT"], ["en_US", "de_CH"], "de_CH"),
+    (["sr_Latn_RS"], ["en_US", "sr_RS"], "sr_RS"),
+    (["xx_YY", "ru_RU"], ["en_US", "ru_RU"], "ru_RU"),
+    (["C", "", "fr_FR"], ["fr_FR"], "fr_FR"),
+    (["ja_JP"], ["en_US", "ru_RU"], None),
+]
+
+
+def _respell(rnd: random.Random, locale_name: str) -> str:
+    """The same locale with random case, separators and encoding"""
+    parts = [rnd.choice((part.lower(), part.upper(), part.title())) for part in locale_name.split("_")]
+    spelled = "".join(part + rnd.choice(("_", "-")) for part in parts)[:-1]
+    return spelled + rnd.choice(("", "", ".UTF-8", ".utf8@euro"))
+
+
+def check_negotiation(rnd: random.Random, rounds: int, folder: str) -> List[str]:
+    """The normalization and fallback rules of choosing a language"""
+    problems = []
+    for locale_name, expected in _NORMALIZED:
+        if lang.normalize_locale(locale_name) != expected:
+            problems.append(f"normalize_locale({locale_name!r}) = "
+                            f"{lang.normalize_locale(locale_name)!r}, expected {expected!r}")
+    for n in range(max(1, rounds // 10)):
+        for requested, available, expected in _NEGOTIATED:
+            if n:
+                requested = [_respell(rnd, name) if name not in ("", "C") else name for name in requested]
+            got = lang.negotiate_lang(requested, available)
+            if got != expected:
+                problems.append(f"negotiate_lang({requested}, {available}) = {got!r}, expected {expected!r}")
+        if len(problems) >= 5:
+            break
+    return problems[:10]
+
+
+def check_lngc(rnd: random.Random, rounds: int, folder: str) -> List[str]:
+    """Random tables written as .lngc and read back"""
+    problems = []
+    alphabet = "abcxyz_019 äöüß日本語ё\n\t$"
+    lng_path = os.path.join(folder, "table.lng")
+    lngc_path = os.path.join(folder, "table.lngc")
+    for n in range(max(1, rounds // 10)):
+        table = {}
+        for _ in range(rnd.randrange(0, 300)):
+            key = "".join(rnd.choice(alphabet[:-6]) for _ in range(rnd.randrange(1, 12))).strip() or "k"
+            table[key] = "".join(rnd.choice(alphabet) for _ in range(rnd.randrange(0, 40)))
+        lngc.write_lngc(table, lngc_path)
+        compiled = lngc.open_compiled(lng_path)
+        if compiled is None:
+            problems.append(f"round {n}: the .lngc file was not opened")
+            continue
+        try:
+            if len(compiled) != len(table) or dict(compiled.items()) != table:
+                problems.append(f"round {n}: the table read back is different")
+            missing = [key + "?" for key in list(table)[:20]] + ["", "absent"]
+            if any(key in compiled or compiled.get(key) is not None for key in missing if key not in table):
+                problems.append(f"round {n}: a missing key was found")
+        finally:
+            compiled.close()
+        if len(problems) >= 5:
+            break
+    return problems
+
+
+CHECKS: Dict[str, Callable[[random.Random, int, str], List[str]]] = {
+    "incremental": check_incremental,
+    "lazy": check_lazy,
+    "fallbacks": check_fallbacks,
+    "cycles": check_cycles,
+    "limits": check_limits,
+    "negotiation": check_negotiation,
+    "lngc": check_lngc,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="checks", description="Equivalence checks of the .lng parser and lang.py")
+    parser.add_argument("--check", action="append", choices=sorted(CHECKS), help="check to run (default: all)")
+    parser.add_argument("--rounds", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failed = 0
+    folder = tempfile.mkdtemp(prefix="lngcheck")
+    try:
+        for name in args.check or list(CHECKS):
+            problems = CHECKS[name](random.Random(args.seed), args.rounds, folder)
+            print(f"{name}: {'FAILED' if problems else 'ok'}")
+            for problem in problems:
+                print(f"  {problem}")
+            failed += bool(problems)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" generator of synthetic .lng files for benchmarks """
+
+import random
+import sys
+from typing import Dict, List
+
+# Settings of the generated files. All numbers are per file, the result
+# depends only on them and on 'seed', so the files are reproducible.
+PROFILES: Dict[str, Dict] = {
+    # a typical add-on: short strings, some references
+    "small": dict(blocks=300, lines=1, words=6, refs=0.3, depth=2, aliases=0.1, switch_every=0),
+    "realistic": dict(blocks=5000, lines=2, words=10, refs=0.5, depth=3, aliases=0.1, switch_every=500),
+    # long multi-paragraph help texts
+    "long_texts": dict(blocks=500, lines=40, words=14, refs=1.0, depth=2, aliases=0.2, switch_every=0),
+    # generated glossaries
+    "large": dict(blocks=100000, lines=1, words=8, refs=0.2, depth=2, aliases=0.0, switch_every=0),
+    # adversarial: long reference chains, many aliases, frequent setting switches
+    # (an alias used again doubles the text of a level, so not together with depth)
+    "deep": dict(blocks=1500, lines=1, words=3, refs=1.0, depth=500, aliases=0.0, switch_every=0),
+    "switches": dict(blocks=5000, lines=1, words=5, refs=1.0, depth=3, aliases=0.3, switch_every=2),
+}
+
+_WORDS = ("card deck note field review answer question interval ease due "
+          "new learning relearn suspend bury tag flag browser editor sync "
+          "profile template style media image sound button options").split()
+
+# Settings used in turn when 'switch_every' is set
+_SETTINGS = (("!!!", "===", "$", "$", ";"), ("!!!", "***", "{", "}", "%"))
+
+
+def generate_lng(blocks: int = 1000, lines: int = 1, words: int = 8, refs: float = 0.3,
+                 depth: int = 2, aliases: float = 0.1, switch_every: int = 0,
+                 seed: int = 0) -> str:
+    """Returns the text of a .lng file.
+    blocks       -number of blocks ('q_<n>' names)
+    lines, words -lines per block and words per line
+    refs         -average number of references in a block (except the leaf level)
+    depth        -number of reference levels: a block of level L refers only to
+                  blocks of level L-1, so the longest chain has 'depth' links
+    aliases      -share of references that create an alias which is used again
+                  (each such reference doubles the inserted text)
+    switch_every -change the separator settings every N blocks (0 -never)"""
+    rnd = random.Random(seed)
+    levels = depth + 1
+    # blocks of each level (a block 'n' has level n % levels)
+    by_level: List[List[int]] = [list(range(level, blocks, levels)) for level in range(levels)]
+
+    settings = _SETTINGS[0]
+    out = [" ".join(settings) + " generated file"]
+    for n in range(blocks):
+        if switch_every and n and n % switch_every == 0:
+            settings = _SETTINGS[(n // switch_every) % len(_SETTINGS)]
+            out.append(" ".join(settings) + " settings switch")
+        vs, vb, vbegin, vend, comment = settings
+        out.append(f"{vb} q_{n} {comment} block {n}")
+
+        level = n % levels
+        # number of references: integer part plus a chance for one more
+        n_refs = 0
+        if level > 0 and by_level[level - 1]:
+            n_refs = int(refs) + (1 if rnd.random() < refs - int(refs) else 0)
+        alias_n = 0
+        for i in range(lines):
+            text = [rnd.choice(_WORDS) for _ in range(words)]
+            # the references are on the first line of the block
+            for _ in range(n_refs if i == 0 else 0):
+                target = rnd.choice(by_level[level - 1])
+                pos = rnd.randrange(len(text) + 1)
+                if rnd.random() < aliases:
+                    alias = f"a{alias_n}"
+                    alias_n += 1
+                    text.insert(pos, f"{vbegin}q_{target} {alias}{vend}")
+                    text.append(f"{vbegin}{alias}{vend}")
+                else:
+                    text.insert(pos, f"{vbegin}q_{target}{vend}")
+            out.append(" ".join(text))
+    out.append("")
+    return "\n".join(out)
+
+
+def write_profile(profile: str, path: str, seed: int = 0) -> str:
+    """Writes the file of a profile from PROFILES and returns its path"""
+    text = generate_lng(seed=seed, **PROFILES[profile])
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in PROFILES:
+        print(f"Usage: python -m <package>.bench.corpus PROFILE out.lng\nProfiles: {', '.join(PROFILES)}")
+        sys.exit(1)
+    write_profile(sys.argv[1], sys.argv[2])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" compact in-memory translation table: one UTF-8 buffer and an array of offsets """
+
+# A dict of translations keeps a separate str object for every value
+# (about 50-80 bytes of overhead each, and 2-4 bytes per character for
+# non-Latin text). 'CompactTable' keeps:
+#   - the keys, interned (so all languages and all tables share one copy), sorted
+#   - all values as one UTF-8 'bytes' buffer
+#   - array('I') of offsets of the values in the buffer
+# A value is decoded when it is requested and remembered in a small cache
+# of hot keys, so the strings of an open dialog are decoded only once.
+
+import sys
+import bisect
+from array import array
+from collections.abc import Mapping
+from typing import Dict
+
+HOT_LIMIT = 512 # decoded values kept at most (the cache is cleared when it is full)
+
+
+class CompactTable(Mapping):
+    """Read-only key->value dictionary with the values packed into one buffer"""
+
+    __slots__ = ("_keys", "_offsets", "_buffer", "_hot")
+
+    def __init__(self, table: Mapping):
+        keys = sorted(table)
+        offsets = array('I', [0])
+        chunks = []
+        total = 0
+        for key in keys:
+            data = table[key].encode('utf-8')
+            chunks.append(data)
+            total += len(data)
+            offsets.append(total)
+        self._keys = [sys.intern(key) for key in keys]
+        self._offsets = offsets
+        self._buffer = memoryview(b"".join(chunks))
+        self._hot: Dict[str, str] = {}
+
+    def _index(self, key) -> int:
+        keys = self._keys
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return i
+        return -1
+
+    def get(self, key: str, default=None):
+        value = self._hot.get(key)
+        if value is not None:
+            return value
+        if not isinstance(key, str):
+            return default
+        i = self._index(key)
+        if i < 0:
+            return default
+        offsets = self._offsets
+        value = str(self._buffer[offsets[i]:offsets[i + 1]], 'utf-8')
+        hot = self._hot
+        if len(hot) >= HOT_LIMIT:
+            hot.clear()
+        hot[key] = value
+        return value
+
+    def __getitem__(self, key: str) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self._index(key) >= 0
+
+    def __iter__(self):
+        """Keys in sorted order"""
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def memory(self) -> int:
+        """Estimated bytes of the table (the interned keys counted once)"""
+        size = sys.getsizeof
+        return (size(self._keys) + sum(size(key) for key in self._keys)
+                + size(self._offsets) + self._buffer.nbytes
+                + size(self._hot) + sum(size(value) for value in self._hot.values()))
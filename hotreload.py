@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" hot reload of the active .lng file while a translator edits it """
+
+# Usage inside the add-on (for example behind a debug option):
+#   from . import hotreload
+#   hotreload.watch(interval=1.0, listener=lambda language: retranslate_open_dialogs())
+#
+# A background thread checks the modification time and size of the active
+# language file once per 'interval' seconds (one os.stat, nothing else while
+# idle). On Linux inotify is used when possible, then a save is noticed at
+# once and the thread sleeps the rest of the time. A changed file is parsed
+# again incrementally (see incremental.py) on the watcher thread; if it has no
+# errors the new table replaces the active one in one step, like 'set_lang',
+# and the listeners are called (on the main thread inside Anki).
+
+import os
+import sys
+import logging
+import threading
+from typing import Callable, List, Optional
+
+from . import adv_settings
+from . import lang
+from . import incremental
+
+DEFAULT_INTERVAL = 1.0 # seconds between checks
+SETTLE_TIME = 0.05 # the file must stay unchanged this long before it is read (editors save in steps)
+
+
+class _Inotify:
+    """Wakes the watcher when a file of the folder is written (Linux only)"""
+
+    IN_CLOSE_WRITE = 0x08
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+
+    def __init__(self, folder: str):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch")
+
+    def wait(self, timeout: float) -> bool:
+        """Waits for a change in the folder at most 'timeout' seconds"""
+        import select
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+        return bool(ready)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LngWatcher:
+    """Watches the file of the active language and reloads it when it changes.
+    'interval' -seconds between checks (the idle cost is one os.stat per interval),
+    'use_inotify' -wait for changes with inotify where available"""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, use_inotify: bool = True):
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.listeners: List[Callable[[str], None]] = []  # functions (language) -> None
+        self.reloads = 0 # successful reloads
+        self.last_update: Optional[incremental.LngUpdate] = None
+        self._parser: Optional[incremental.IncrementalLngParser] = None
+        self._path = None # file the parser has read
+        self._signature = None # (mtime, size) of the file when it was last checked
+        self._watched = None # file the signature belongs to
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def add_listener(self, listener: Callable[[str], None]):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str], None]):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the watcher thread (a daemon, it does not keep Anki from closing)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._watched = self._active_path()
+        self._signature = self._stat(self._watched)  # only later changes are reloaded
+        self._thread = threading.Thread(target=self._run, name="lang-hotreload", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        inotify = None
+        if self.use_inotify and sys.platform.startswith("linux"):
+            try:
+                inotify = _Inotify(lang._lang_dir())
+            except (OSError, AttributeError):
+                inotify = None  # polling only
+        try:
+            while not self._stop.is_set():
+                if inotify is not None:
+                    inotify.wait(self.interval)
+                else:
+                    self._stop.wait(self.interval)
+                if not self._stop.is_set():
+                    try:
+                        self.check()
+                    except Exception as e:  # the watcher must not die because of one bad save
+                        self._report(e)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _report(self, error: Exception):
+        """A failed check goes where the parser diagnostics go: to 'get_load_diagnostics'
+        (unless 'set_lang' was called since) and to the 'logging' module"""
+        diagnostics = adv_settings.Diagnostics()
+        diagnostics.attach_logger(logging.getLogger(__name__))
+        diagnostics.add(adv_settings.Diagnostic(adv_settings.ERROR, "reload_failed", 0, "",
+                                                (self._watched, error)))
+        with lang._swap_lock:
+            if self._watched == self._active_path():
+                lang._load_diagnostics = diagnostics
+
+    @staticmethod
+    def _active_path() -> str:
+        return os.path.join(lang._lang_dir(), f"{lang.get_lang().replace('-', '_')}.lng")
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def check(self) -> bool:
+        """One check: reloads the active language if its file has changed.
+        Can also be called from a timer on the main thread instead of 'start'.
+        Returns True if a new table was published"""
+        language = lang.get_lang()
+        path = self._active_path()
+        signature = self._stat(path)
+        if path != self._watched:
+            # 'set_lang' switched the language and has just read the new file
+            self._watched = path
+            self._signature = signature
+            return False
+        if signature is None or signature == self._signature:
+            return False
+        self._stop.wait(SETTLE_TIME)
+        if self._stat(path) != signature:
+            return False  # still being written, the next check will see it
+        self._signature = signature
+        with lang._swap_lock:
+            generation = lang._load_generation
+
+        # fresh records for this reload (the published ones are not changed afterwards)
+        stats = adv_settings.ParseStats()
+        diagnostics = adv_settings.Diagnostics()
+        if self._parser is None or self._path != path:
+            self._parser = incremental.IncrementalLngParser()
+            self._parser.logging_to_screen = False
+            self._path = path
+        parser = self._parser
+        parser.stats = stats
+        parser.diagnostics = diagnostics
+        self.last_update = parser.update_file(path)  # the first time the whole file
+        if not parser.ok:
+            # the active table stays as it is until the errors are fixed
+            with lang._swap_lock:
+                if generation == lang._load_generation:
+                    lang._load_stats = stats
+                    lang._load_diagnostics = diagnostics
+            return False
+        table = dict(parser.translations)  # the parser changes its dictionary in place
+        table = lang._finish_table(language, table, lang.get_fallback_chain(), stats)
+        with lang._swap_lock:
+            if generation != lang._load_generation or lang.get_lang() != language:
+                return False  # 'set_lang' was called in the meantime
+            lang._load_stats = stats
+            lang._load_diagnostics = diagnostics
+            lang._publish(language, table)
+        self.reloads += 1
+        self._notify(language)
+        return True
+
+    def _notify(self, language: str):
+        listeners = list(self.listeners)
+        if not listeners:
+            return
+
+        def call():
+            for listener in listeners:
+                listener(language)
+
+        taskman = getattr(lang._get_mw(), "taskman", None)
+        if taskman is not None and threading.current_thread() is not threading.main_thread():
+            taskman.run_on_main(call)
+        else:
+            call()
+
+
+_watcher: Optional[LngWatcher] = None
+
+def watch(interval: float = DEFAULT_INTERVAL, listener: Optional[Callable[[str], None]] = None,
+          use_inotify: bool = True) -> LngWatcher:
+    """Starts (or reconfigures) the common watcher of the active language"""
+    global _watcher
+    if _watcher is None:
+        _watcher = LngWatcher(interval, use_inotify)
+    _watcher.interval = interval
+    if listener is not None and listener not in _watcher.listeners:
+        _watcher.add_listener(listener)
+    _watcher.start()
+    return _watcher
+
+
+def stop():
+    """Stops the common watcher"""
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
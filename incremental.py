@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" incremental re-parsing of an edited .lng file """
+
+# The parser keeps an index of the file: one entry for each settings line and
+# each block (first line, the settings in effect before it, names, text and the
+# names it refers to), and a reverse index "block -> blocks that refer to it".
+#
+# On an update the old and the new lines are compared from the beginning and
+# from the end. Parsing starts again at the entry that contains the last
+# unchanged line and stops at the first entry in the unchanged tail that
+# starts with the same settings as before; the rest of the index is only
+# shifted. Then only the blocks whose text or settings changed are resolved
+# again, together with all the blocks that use them (directly or not).
+
+import os
+import time
+import bisect
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    from . import adv_settings
+except ImportError:  # run as a script
+    import adv_settings
+
+
+# vs, vb, vbegin, vend, comment
+ParserState = Tuple[str, str, str, str, str]
+
+
+class IndexEntry(NamedTuple):
+    """A settings line (no names) or a block of the file"""
+    start_line: int
+    state: ParserState                 # settings in effect before this line
+    names: Tuple[str, ...]             # block names, () for a settings line
+    text: str                          # block text (or the settings line)
+    settings: Optional[adv_settings.BlockSettings]
+    refs: FrozenSet[str]               # names used in references of the block
+
+
+class LngUpdate(NamedTuple):
+    """Result of 'IncrementalLngParser.update'"""
+    changed: Tuple[str, ...]    # keys whose value was resolved again (or added)
+    removed: Tuple[str, ...]    # keys that no longer exist
+    first_line: int             # lines parsed again (in the new text), 0 -none
+    last_line: int
+    resolved: int               # number of blocks resolved again
+    full: bool                  # the whole file was parsed
+
+
+class IncrementalLngParser(adv_settings.LngParser):
+    """Parser that keeps the result of the last parse and, after the file
+    was edited, parses and resolves again only what has changed.
+    'translations' is the current key->value dictionary (with the values of failed
+    blocks as in 'parse_file'), 'ok' tells whether the file has no errors.
+    'errors' and 'warnings' count the messages of the last update"""
+
+    def __init__(self):
+        super().__init__()
+        self.translations: Dict[str, str] = {}
+        self.index: List[IndexEntry] = []
+        self._initial_state = self._state()
+        self._final_state = self._initial_state
+        self._lines: List[str] = []
+        self._offsets: Optional[List[int]] = None  # byte offset of each line (built on request)
+        self._refs: Dict[str, FrozenSet[str]] = {}  # names used by each block
+        self._dependents: Dict[str, Set[str]] = {}  # name -> blocks that refer to it
+
+    def _state(self) -> ParserState:
+        return (self.vs, self.vb, self.vbegin, self.vend, self.comment)
+
+    def _set_state(self, state: ParserState):
+        self.vs, self.vb, self.vbegin, self.vend, self.comment = state
+
+    @property
+    def ok(self) -> bool:
+        """No block has errors"""
+        return not self._failed
+
+    def load(self, filepath: str) -> Dict[str, str]:
+        """Parses the whole file (the same result as 'parse_file')"""
+        self.index = []
+        self._lines = []
+        self.stats.path = filepath
+        self.update_file(filepath)
+        return self.translations
+
+    def update_file(self, filepath: str) -> LngUpdate:
+        """Reads the file again and applies the changes"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            text = f.read()
+        self.stats.path = filepath
+        return self.update(text)
+
+    def update(self, text: str) -> LngUpdate:
+        """Applies the new text of the file: parses again only the changed region
+        and resolves again only the changed blocks and the blocks that use them"""
+        lines = text.split("\n")
+        if lines and lines[-1] == "":
+            lines.pop()  # a line end at the end of the file
+        old_lines = self._lines
+        full = not self.index
+
+        # common beginning and end of the old and the new lines
+        prefix = 0
+        if not full:
+            limit = min(len(old_lines), len(lines))
+            while prefix < limit and old_lines[prefix] == lines[prefix]:
+                prefix += 1
+            if prefix == len(old_lines) == len(lines):
+                return LngUpdate((), (), 0, 0, 0, False)
+            suffix = 0
+            limit -= prefix
+            while suffix < limit and old_lines[-1 - suffix] == lines[-1 - suffix]:
+                suffix += 1
+        else:
+            suffix = 0
+
+        self.warnings = 0
+        self.errors = 0
+        path = self.stats.path
+        self.stats.reset()
+        self.stats.path = path
+        self.stats.source = "incremental"
+        start = time.perf_counter()
+
+        # the entry from which parsing starts again: the one with the last unchanged line
+        old_index = self.index
+        if full or prefix == 0:
+            first = 0
+        else:
+            starts = [entry.start_line for entry in old_index]
+            first = max(bisect.bisect_right(starts, prefix) - 1, 0)
+        first_line = old_index[first].start_line if old_index and first else 1
+        state = old_index[first].state if old_index and first else self._initial_state
+
+        # parsing stops at an old entry of the unchanged end with the same settings
+        delta = len(lines) - len(old_lines)
+        tail_start = len(lines) - suffix + 1
+        old_starts = {entry.start_line: i for i, entry in enumerate(old_index[first:], first)}
+
+        def resync(line: int, line_state: ParserState) -> Optional[int]:
+            if line < tail_start:
+                return None
+            i = old_starts.get(line - delta)
+            if i is not None and old_index[i].state == line_state:
+                return i
+            return None
+
+        new_entries, new_tokens, rest, last_line = self._parse_region(lines, first_line, state, resync)
+        if rest is None:
+            tail = []
+            self._final_state = self._state()
+        else:
+            tail = [entry._replace(start_line=entry.start_line + delta) for entry in old_index[rest:]] if delta \
+                else old_index[rest:]
+            self._set_state(self._final_state)  # the end of the file has not changed
+        removed_entries = old_index[first:rest] if rest is not None else old_index[first:]
+        self.index = old_index[:first] + new_entries + tail
+        self._lines = lines
+        self._offsets = None
+        self.stats.lines = len(lines)
+        self.stats.time_pass1 = time.perf_counter() - start
+
+        # blocks whose text or settings changed
+        touched = set()
+        for entry in removed_entries:
+            touched.update(entry.names)
+        for entry in new_entries:
+            touched.update(entry.names)
+        old_blocks = self.blocks
+        self.blocks = {}
+        self.block_lines = {}
+        for entry in self.index:
+            if entry.names:
+                if full:
+                    self._save_blocks(list(entry.names), entry.text, entry.settings, entry.start_line,
+                                      entry.start_line)
+                else:
+                    for name in entry.names:
+                        self.blocks[name] = (entry.text, entry.settings)
+                        self.block_lines[name] = entry.start_line
+        self.stats.blocks = len(self.blocks)
+        changed = [name for name in touched if old_blocks.get(name) != self.blocks.get(name)]
+        if full:
+            changed = list(self.blocks)
+
+        # the reverse index of references
+        if full:
+            self._refs = {}
+            self._dependents = {}
+        refs_of = {}
+        tokens_of = {}
+        for entry, tokens in zip(new_entries, new_tokens):
+            for name in entry.names:
+                if self.blocks.get(name) == (entry.text, entry.settings):
+                    refs_of[name] = entry.refs
+                    tokens_of[name] = tokens
+        missing = {name for name in changed if name in self.blocks and name not in refs_of}
+        if missing:
+            # an earlier block with the same name outside the region is in effect now
+            for entry in reversed(self.index):
+                for name in entry.names:
+                    if name in missing and name not in refs_of:
+                        refs_of[name] = entry.refs
+        for name in changed:
+            for ref in self._refs.pop(name, ()):
+                self._dependents.get(ref, set()).discard(name)
+            refs = refs_of.get(name)
+            if refs is not None and name in self.blocks:
+                self._refs[name] = refs
+                for ref in refs:
+                    if ref != name:
+                        self._dependents.setdefault(ref, set()).add(name)
+
+        # all the blocks that use the changed ones
+        dirty = set(changed)
+        work = list(changed)
+        while work:
+            for dependent in self._dependents.get(work.pop(), ()):
+                if dependent not in dirty:
+                    dirty.add(dependent)
+                    work.append(dependent)
+
+        self._report(adv_settings.DEBUG, "pass2")
+        if full:
+            self._tokens = {}
+            self._resolved = {}
+            self._failed = set()
+            self._expanded_total = 0
+            self._added = {}
+        for name in dirty:
+            self._resolved.pop(name, None)
+            # exactly what the block added (also a block that was resolved with errors)
+            self._expanded_total -= self._added.pop(name, 0)
+            self._failed.discard(name)
+            self._tokens.pop(name, None)
+        for name, tokens in tokens_of.items():
+            if name in dirty:
+                self._tokens[name] = tokens  # already split while parsing
+        self._resolve_names([name for name in dirty if name in self.blocks])
+        removed = []
+        if full:
+            self.translations = {name: self._value(name) for name in self.blocks}
+        else:
+            for name in dirty:
+                if name in self.blocks:
+                    self.translations[name] = self._value(name)
+                elif self.translations.pop(name, None) is not None:
+                    removed.append(name)
+        self.stats.errors = self.errors
+        self.stats.warnings = self.warnings
+        self._report(adv_settings.INFO, "incremental", 0, "", first_line, last_line, len(dirty))
+        return LngUpdate(tuple(name for name in dirty if name in self.blocks), tuple(removed),
+                         first_line, last_line, len(dirty), full)
+
+    def _parse_region(self, lines: List[str], first_line: int, state: ParserState, resync):
+        """Parses the lines from 'first_line' with the settings 'state' until 'resync'
+        finds an old entry to continue with. Returns (new entries, their tokens,
+        index of that old entry or None if parsed to the end, last parsed line)"""
+        self._set_state(state)
+        entries = []
+        entry_tokens = []
+        rest = None
+        last_line = len(lines)
+        events = self.iter_events(lines[first_line - 1:], first_line, emit_lines=False)
+        for event in events:
+            kind = event.kind
+            if kind == adv_settings.EVENT_SETTINGS or kind == adv_settings.EVENT_BLOCK_START:
+                rest = resync(event.line, state)
+                if rest is not None:
+                    last_line = event.line - 1
+                    break
+                if kind == adv_settings.EVENT_SETTINGS:
+                    entries.append(IndexEntry(event.line, state, (), event.text, None, frozenset()))
+                    entry_tokens.append(None)
+                    state = self._state()  # the line has already been applied
+                else:
+                    entry_state = state
+            elif kind == adv_settings.EVENT_BLOCK_END:
+                tokens = adv_settings.tokenize_block(event.text, event.settings)
+                refs = frozenset(token.name for token in tokens if token.__class__ is adv_settings.Reference)
+                entries.append(IndexEntry(event.start_line, entry_state, event.names, event.text,
+                                          event.settings, refs))
+                entry_tokens.append(tokens)
+        events.close()
+        return entries, entry_tokens, rest, last_line
+
+    def dependents(self, name: str) -> Set[str]:
+        """Blocks that refer to the block directly"""
+        return set(self._dependents.get(name, ()))
+
+    def block_range(self, name: str) -> Optional[Tuple[int, int, int, int]]:
+        """(first line, last line, first byte, end byte) of the block in the text,
+        lines are counted from 1 and the bytes are of UTF-8 text with '\\n' line ends.
+        None if there is no such block"""
+        start_line = self.block_lines.get(name)
+        if start_line is None:
+            return None
+        starts = [entry.start_line for entry in self.index]
+        i = bisect.bisect_right(starts, start_line)
+        end_line = starts[i] - 1 if i < len(starts) else len(self._lines)
+        if self._offsets is None:
+            offsets = [0]
+            total = 0
+            for line in self._lines:
+                total += len(line.encode('utf-8')) + 1
+                offsets.append(total)
+            self._offsets = offsets
+        return start_line, end_line, self._offsets[start_line - 1], self._offsets[end_line]
+
+
+# Watching a file from the command line: python incremental.py file.lng
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python incremental.py file.lng")
+        sys.exit(1)
+    filename = sys.argv[1]
+    parser = IncrementalLngParser()
+    parser.logging_to_screen = False
+    parser.load(filename)
+    print(f"{len(parser.translations)} translations, blocks with errors: {len(parser._failed)}  (Ctrl+C to stop)")
+    mtime = os.stat(filename).st_mtime_ns
+    try:
+        while True:
+            time.sleep(0.5)
+            new_mtime = os.stat(filename).st_mtime_ns
+            if new_mtime == mtime:
+                continue
+            mtime = new_mtime
+            before = len(parser.diagnostics.records)
+            result = parser.update_file(filename)
+            print(f"lines {result.first_line}-{result.last_line} parsed again, "
+                  f"{result.resolved} blocks resolved again in {parser.stats.time_total * 1000:.1f} ms, "
+                  f"blocks with errors: {len(parser._failed)}")
+            for record in parser.diagnostics.records[before:]:
+                print(f"  {record}")
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" generator of a module with the key constants of a reference .lng pack """
+
+# The generated module contains:
+#   - a constant for each key:  q_Card_internal = "q_Card_internal"
+#     (string literals that look like identifiers are interned by Python,
+#     so a lookup with them does not build a new string)
+#   - KEYS: frozenset of all keys
+#   - Strings: a class with '__slots__' for the keys, filled from a table
+#     (lang.get_strings(Strings)), so call sites use plain attribute access
+# A misspelled key is an ImportError at 'from .lang_keys import q_Misspelled'
+# (when the add-on starts), not an empty string when the menu is opened.
+#
+# Only the block names are read (no references are resolved), and the file is
+# not rewritten if the set of keys has not changed, so the step is cheap to run
+# on every build.
+
+import os
+import re
+import sys
+import hashlib
+import keyword
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from . import adv_settings
+except ImportError:  # run as a script
+    import adv_settings
+
+KEYGEN_VERSION = 2
+DEFAULT_MODULE = "lang_keys.py"
+DEFAULT_IDS_MODULE = "lang_ids.py"
+KEYIDS_FILE = "keyids.json" # registry of the integer key IDs (keep it under version control)
+
+_HASH_LINE = "# keys-sha1: "
+# names that the generated modules use themselves (a key with such a name
+# would replace them), these keys get no constant
+_RESERVED = frozenset(("KEYS", "KEY_COUNT", "Strings", "frozenset", "setattr"))
+
+
+def read_keys(lng_path: str) -> List[str]:
+    """Block names of the .lng file in the order of the file (without parsing the values)"""
+    parser = adv_settings.LngParser()
+    parser.logging_to_screen = False
+    keys: Dict[str, None] = {}
+    for event in parser.iter_file_blocks(lng_path):
+        for name in event.names:
+            keys[name] = None
+    return list(keys)
+
+
+def _identifiers(keys: Iterable[str]) -> Tuple[Dict[str, str], List[str]]:
+    """Constant name -> key, and the keys that cannot be a Python name
+    (or would clash with the names of the generated module)"""
+    names: Dict[str, str] = {}
+    skipped = []
+    for key in keys:
+        if (key.isidentifier() and not keyword.iskeyword(key) and not key.startswith("__")
+                and key not in _RESERVED):
+            names[key] = key
+        else:
+            skipped.append(key)
+    return names, skipped
+
+
+def _keys_digest(keys: Iterable[str]) -> str:
+    data = "\n".join(sorted(keys)).encode('utf-8')
+    return hashlib.sha1(f"{KEYGEN_VERSION}\n".encode() + data).hexdigest()
+
+
+def _ids_digest(keys_by_id: List[str]) -> str:
+    return _keys_digest(f"{i} {key}" for i, key in enumerate(keys_by_id))
+
+
+def _read_digest(module_path: str) -> Optional[str]:
+    """Digest written in the header of an earlier generated module"""
+    try:
+        with open(module_path, 'r', encoding='utf-8') as f:
+            for _ in range(5):
+                line = f.readline()
+                if line.startswith(_HASH_LINE):
+                    return line[len(_HASH_LINE):].strip()
+    except OSError:
+        pass
+    return None
+
+
+def render_module(keys: List[str], source_name: str = "") -> str:
+    """Text of the generated module for the list of keys"""
+    names, skipped = _identifiers(keys)
+    lines = [
+        "# -*- coding: utf-8 -*-",
+        f"# Generated by keygen.py from '{source_name}', do not edit.",
+        f"{_HASH_LINE}{_keys_digest(keys)}",
+        '""" key constants of the localization """',
+        "",
+    ]
+    for name in names:
+        lines.append(f"{name} = {name!r}")
+    lines.append("")
+    if skipped:
+        lines.append("# keys that are not valid Python names or are names of this module (use them as strings):")
+        for key in skipped:
+            lines.append(f"#   {key!r}")
+        lines.append("")
+    lines.append("KEYS = frozenset((")
+    for key in keys:
+        lines.append(f"    {key!r},")
+    lines.append("))")
+    lines += [
+        "",
+        "",
+        "class Strings:",
+        '    """Strings of one language as attributes (see lang.get_strings)"""',
+        "    __slots__ = (",
+    ]
+    for name in names:
+        lines.append(f"        {name!r},")
+    lines += [
+        "    )",
+        "",
+        "    def __init__(self, table, default=\"\"):",
+        "        get = table.get",
+        "        for name in self.__slots__:",
+        "            setattr(self, name, get(name, default))",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def generate_keys_module(lng_path: str, module_path: Optional[str] = None, force: bool = False) -> bool:
+    """Writes the module of key constants for the reference pack (atomically).
+    Returns False if the module already has the same keys and was left as it is"""
+    if module_path is None:
+        module_path = os.path.join(os.path.dirname(os.path.abspath(lng_path)), DEFAULT_MODULE)
+    keys = read_keys(lng_path)
+    if not force and _read_digest(module_path) == _keys_digest(keys):
+        return False
+    adv_settings.write_file_atomic(module_path, render_module(keys, os.path.basename(lng_path)))
+    return True
+
+
+# Integer key IDs. The registry is a JSON list of keys, the position of a key
+# is its ID: new keys are only appended and removed keys keep their place,
+# so an ID never changes and is the same for all language packs.
+
+def read_key_ids(registry_path: str) -> List[str]:
+    """Keys by ID from the registry ([] if there is none)"""
+    import json
+    try:
+        with open(registry_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except OSError:
+        return []
+    keys = data.get("keys") if isinstance(data, dict) else None
+    if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        raise ValueError(f"damaged key ID registry: {registry_path}")
+    return keys
+
+
+def update_key_ids(keys: Iterable[str], registry_path: str) -> List[str]:
+    """Gives IDs to the keys that do not have one yet and saves the registry
+    (only if something was added). Returns the keys by ID"""
+    import json
+    by_id = read_key_ids(registry_path)
+    known = set(by_id)
+    added = [key for key in keys if key not in known]
+    if added:
+        by_id = by_id + list(dict.fromkeys(added))
+        text = json.dumps({"version": KEYGEN_VERSION, "keys": by_id}, ensure_ascii=False, indent=0)
+        adv_settings.write_file_atomic(registry_path, text + "\n")
+    return by_id
+
+
+def render_ids_module(keys_by_id: List[str], source_name: str = "") -> str:
+    """Text of the module with the ID constants"""
+    names, skipped = _identifiers(keys_by_id)
+    ids = {key: i for i, key in enumerate(keys_by_id)}
+    lines = [
+        "# -*- coding: utf-8 -*-",
+        f"# Generated by keygen.py from '{source_name}', do not edit.",
+        f"{_HASH_LINE}{_ids_digest(keys_by_id)}",
+        '""" integer IDs of the localization keys (for lang.qi) """',
+        "",
+        f"KEY_COUNT = {len(keys_by_id)}",
+        "",
+    ]
+    for name in names:
+        lines.append(f"{name} = {ids[name]}")
+    if skipped:
+        lines.append("")
+        lines.append("# keys that are not valid Python names or are names of this module:")
+        for key in skipped:
+            lines.append(f"#   {ids[key]}: {key!r}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def generate_ids_module(lng_path: str, registry_path: Optional[str] = None,
+                        module_path: Optional[str] = None, force: bool = False) -> bool:
+    """Adds the keys of the reference pack to the ID registry and writes the module
+    of ID constants. Returns False if the module did not have to change"""
+    folder = os.path.dirname(os.path.abspath(lng_path))
+    if registry_path is None:
+        registry_path = os.path.join(folder, KEYIDS_FILE)
+    if module_path is None:
+        module_path = os.path.join(folder, DEFAULT_IDS_MODULE)
+    keys_by_id = update_key_ids(read_keys(lng_path), registry_path)
+    if not force and _read_digest(module_path) == _ids_digest(keys_by_id):
+        return False
+    adv_settings.write_file_atomic(module_path, render_ids_module(keys_by_id, os.path.basename(registry_path)))
+    return True
+
+
+# q("key"), _("key"), get_translation("key") with a literal key
+_CALL_RE = re.compile(r"""\b(?:q|_|get_translation)\(\s*(?:r|u)?(["'])([^"'\\\n]+)\1""")
+
+
+def find_unknown_keys(source_paths: Iterable[str], keys: Iterable[str]) -> List[Tuple[str, int, str]]:
+    """Literal keys in calls of q() in the source files that are not in 'keys'.
+    Returns (file, line, key)"""
+    known = set(keys)
+    unknown = []
+    for path in source_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for n_line, line in enumerate(f, 1):
+                for match in _CALL_RE.finditer(line):
+                    key = match.group(2).strip()
+                    if key not in known:
+                        unknown.append((path, n_line, key))
+    return unknown
+
+
+# From the command line:
+#   python keygen.py en_US.lng [lang_keys.py]         -generate the module
+#   python keygen.py en_US.lng --check file.py ...    -list unknown keys in q() calls
+#   python keygen.py en_US.lng --ids [lang_ids.py]    -update keyids.json and the ID module
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python keygen.py reference.lng [module.py] [--check file.py ...] [--ids [module.py]]")
+        sys.exit(1)
+    source = sys.argv[1]
+    if "--ids" in sys.argv:
+        rest = sys.argv[sys.argv.index("--ids") + 1:]
+        target = rest[0] if rest else None
+        if generate_ids_module(source, module_path=target):
+            print(f"Generated: {target or DEFAULT_IDS_MODULE}")
+        else:
+            print("The key IDs have not changed")
+        sys.exit(0)
+    if "--check" in sys.argv:
+        files = sys.argv[sys.argv.index("--check") + 1:]
+        unknown = find_unknown_keys(files, read_keys(source))
+        for path, n_line, key in unknown:
+            print(f"{path}:{n_line}: unknown key '{key}'")
+        sys.exit(1 if unknown else 0)
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    if generate_keys_module(source, target):
+        print(f"Generated: {target or DEFAULT_MODULE}")
+    else:
+        print("The keys have not changed")
@@ -4,37 +4,466 @@
 # Version 1.0, date: 2026-01-08
 """ addon localization language """
 
-from aqt import mw
-import anki.lang
-from aqt.utils import (showText, showInfo, tooltip) 
-
+# Only the standard library is imported here, so the module also works outside
+# Anki (build scripts, tests, validators). Anki's modules are taken from
+# 'sys.modules' when Anki has already loaded them (see '_get_mw').
 import os
-import json
-from typing import Dict, List, Tuple
+import sys
+import time
+import bisect
+import threading
+from typing import Dict, List, Tuple, Mapping, Optional, Callable, Iterable
 from . import adv_settings
+from . import lngc
+from . import lngpy
 
-_translations: Dict[str, str] = {} # Current translations (only downloaded for the active language)
+_translations: Mapping[str, str] = {} # Current translations (only downloaded for the active language)
 _language: str = "en" # Default language if not changed using 'set_lang'
 _language_full_name = "English (United States)"
+_load_stats = adv_settings.ParseStats() # Timings and counters of the last 'set_lang'
+_load_diagnostics = adv_settings.Diagnostics() # Warnings and errors of the last 'set_lang'
+
+def _get_mw():
+    """ Anki's main window, or None outside Anki (aqt is never imported by this module) """
+    aqt = sys.modules.get("aqt")
+    return getattr(aqt, "mw", None) if aqt is not None else None
+
+
+def _get_anki_lang() -> Optional[str]:
+    """ Anki's interface language, or None outside Anki """
+    anki_lang = sys.modules.get("anki.lang")
+    return getattr(anki_lang, "current_lang", None) if anki_lang is not None else None
+
+
+_swap_lock = threading.Lock() # Publishing of a new table and the counter of loads
+_load_generation = 0 # Increases with each 'set_lang', older background loads are discarded
+_executor = None # Worker for 'set_lang_async' outside Anki
+_fallback_chain: List[str] = [] # Languages whose strings fill the keys missing in the active one
+
+_cache_lock = threading.Lock()
+_table_cache: Dict[tuple, Dict] = {} # Loaded tables by (language, fallbacks, lazy), the least recently used first
+_cache_budget = 16 << 20 # Estimated bytes the cached tables may take (0 -no cache)
+_compact = False # Keep loaded tables as 'compact.CompactTable' (see 'set_compact', imported only then)
+
+_id_keys: Optional[List[str]] = None # Keys by integer ID, shared by all languages (see 'use_key_ids')
+_id_lookup = None # (active table, keys by ID, its values by ID) for 'qi', replaced in one step
+_UNREAD = object() # Value by ID not read from the table yet
+
+_shared = False # Use the process-wide registry of all add-ons (see 'use_shared_registry', imported only then)
+_addon_name = __name__.rpartition(".")[0] or __name__ # Name of this add-on in the registry
 
-def set_lang(language : str):    
-    """ Set the addon localization language (only if the 'language.lng' file exists) """
-    global _language, _translations
+
+def _load_table(language : str, lazy : bool = False, fallbacks : Iterable[str] = ()):
+    """ Loads the table of the language without changing the current one (can run on any thread).
+    The keys missing in it are taken from the 'fallbacks' languages (in this order).
+    Returns (table or None, stats, diagnostics), (None, None, None) if there is no file """
     normalized_lang = language.replace("-", "_")
     current_dir = os.path.dirname(os.path.abspath(__file__))
     translation_file = f"{normalized_lang}.lng"
     translation_path = os.path.join(current_dir, translation_file)    
-    if not os.path.exists(translation_path) and os.path.isfile(translation_path):
-        return False     
+    stats = adv_settings.ParseStats()
+    diagnostics = adv_settings.Diagnostics()
+    start = time.perf_counter()
+    result = lngc.open_compiled(translation_path)
+    source = "lngc"
+    if result is None:
+        result = lngpy.open_module(translation_path)
+        source = "module"
+    if result is None:
+        if not os.path.isfile(translation_path):
+            return None, None, None
+        result = adv_settings.load_lng(translation_path, logging_to_screen = False, use_cache = True, 
+                                       lazy = lazy, stats = stats, diagnostics = diagnostics)
     else:
-        result = adv_settings.load_lng(translation_path, logging_to_screen = False)
-        if result:            
-            _translations = result
-            _language = language
-            _language_full_name = get_lang_full_name(language) 
-            return True
+        stats.path = getattr(result, "path", lngpy.get_module_path(translation_path))
+        stats.source = source
+        stats.time_read = time.perf_counter() - start
+        stats.blocks = len(result)
+    if not _key_count(result):
+        return None, stats, diagnostics
+    return _finish_table(language, result, fallbacks, stats), stats, diagnostics
+
+
+def _finish_table(language : str, table : Mapping[str, str], fallbacks : Iterable[str],
+                  stats : adv_settings.ParseStats) -> Mapping[str, str]:
+    """ The steps after parsing that every table goes through before it is published
+    (also one reloaded by hotreload.py): fallbacks, shared strings, compact form """
+    table = _merge_fallbacks(language, table, fallbacks, stats)
+    if _shared and type(table) is dict:
+        from . import registry
+        registry.share_values(table)  # before packing: a compact table keeps its own buffer
+    if _compact and isinstance(table, dict):
+        from . import compact  # only with 'set_compact', the module is optional
+        table = compact.CompactTable(table)
+    return table
+
+
+def _merge_fallbacks(language : str, table : Mapping[str, str], fallbacks : Iterable[str],
+                     stats : adv_settings.ParseStats) -> Mapping[str, str]:
+    """ One dictionary with the keys of 'table' and the keys missing in it from the
+    fallback languages, so 'q' still does a single lookup. 'stats.fallbacks' gets
+    (language, number of keys it supplied) for each level. If the fallbacks add
+    nothing, the table is returned as it is. A key of a lazy table whose value
+    has errors counts as missing (the keys are read with 'get') """
+    levels = [(language, _key_count(table))]
+    merged = None
+    for code in fallbacks:
+        if code == language:
+            continue
+        fallback, _, _ = _load_table(code)
+        if fallback is None:
+            levels.append((code, 0))
+            continue
+        known = merged if merged is not None else table
+        missing = [key for key in fallback if known.get(key) is None]
+        if missing:
+            if merged is None:
+                # a lazy or .lngc table becomes a plain dict here
+                merged = {}
+                get = table.get
+                for key in table:
+                    value = get(key)
+                    if value is not None:
+                        merged[key] = value
+            get = fallback.get
+            merged.update((key, get(key)) for key in missing)
+        levels.append((code, len(missing)))
+        if isinstance(fallback, lngc.LngcTable):
+            fallback.close()
+    stats.fallbacks = levels
+    if merged is None:
+        return table
+    if isinstance(table, lngc.LngcTable):
+        table.close()
+    return merged
+
+
+def _source_signature(language : str, fallbacks : Iterable[str]) -> tuple:
+    """ Modification times of the files the table is loaded from (the language and its fallbacks) """
+    signature = []
+    for code in (language, *fallbacks):
+        lng_path = os.path.join(_lang_dir(), f"{code}.lng")
+        for path in (lng_path, os.path.splitext(lng_path)[0] + ".lngc", lngpy.get_module_path(lng_path)):
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                signature.append(None)
+    return tuple(signature)
+
+
+def _key_count(table : Mapping[str, str]) -> int:
+    """ len(table), but a lazy table is not resolved for it (its blocks are counted,
+    also the ones that may still fail) """
+    if isinstance(table, adv_settings.LazyTranslations):
+        return table.block_count
+    return len(table)
+
+
+def _table_memory(table : Mapping[str, str]) -> int:
+    """ Estimated bytes of a table (of a '.lngc' only the decoded strings,
+    the mapped file itself is in the OS page cache) """
+    size = sys.getsizeof
+    if isinstance(table, dict):
+        return size(table) + sum(size(key) + size(value) for key, value in table.items())
+    compact = sys.modules.get(f"{__package__}.compact")  # not imported if never used
+    if compact is not None and isinstance(table, compact.CompactTable):
+        return table.memory()
+    if isinstance(table, lngc.LngcTable):
+        return size(table._hot) + sum(size(key) + size(value) for key, value in table._hot.items())
+    if isinstance(table, adv_settings.LazyTranslations):
+        parser = table._parser
+        return (size(table._ready) + sum(size(value) for value in table._ready.values())
+                + sum(size(key) + size(text) for key, (text, _) in parser.blocks.items()))
+    return size(table)
+
+
+def _get_table(language : str, lazy : bool = False, fallbacks : Iterable[str] = ()):
+    """ Like '_load_table', but a table loaded earlier is taken from the memory cache
+    if its files have not changed since then """
+    language = language.replace("-", "_")
+    fallbacks = tuple(code for code in fallbacks if code != language)
+    key = (language, fallbacks, lazy)
+    start = time.perf_counter()
+    signature = _source_signature(language, fallbacks) if _cache_budget > 0 else None
+    with _cache_lock:
+        entry = _table_cache.pop(key, None)
+        if entry is not None and entry["signature"] != signature:
+            _close_dropped(entry["table"])  # its files have changed
+            entry = None
+        if entry is not None:
+            _table_cache[key] = entry  # now the most recently used
+            stats = adv_settings.ParseStats()
+            stats.path = entry["stats"].path
+            stats.source = "memory"
+            stats.blocks = _key_count(entry["table"])
+            stats.fallbacks = entry["stats"].fallbacks
+            stats.time_read = time.perf_counter() - start
+            return entry["table"], stats, entry["diagnostics"]
+    result, stats, diagnostics = _load_table(language, lazy, fallbacks)
+    if result is not None and _cache_budget > 0:
+        entry = {"table": result, "stats": stats, "diagnostics": diagnostics,
+                 "signature": signature, "bytes": _table_memory(result)}
+        with _cache_lock:
+            _table_cache[key] = entry
+            _evict_to_budget()
+    return result, stats, diagnostics
+
+
+def _evict_to_budget():
+    """ Drops the least recently used tables until the rest fit in the budget
+    (the most recent one always stays). Call with '_cache_lock' held """
+    total = sum(entry["bytes"] for entry in _table_cache.values())
+    while total > _cache_budget and len(_table_cache) > 1:
+        entry = _table_cache.pop(next(iter(_table_cache)))
+        total -= entry["bytes"]
+        _close_dropped(entry["table"])
+
+
+def _clear_cache():
+    """ Drops all cached tables. Call with '_cache_lock' held """
+    for entry in _table_cache.values():
+        _close_dropped(entry["table"])
+    _table_cache.clear()
+
+
+def _close_dropped(table : Mapping[str, str]):
+    """ Closes a '.lngc' table dropped from the memory cache unless it is the active one:
+    its open mmap would keep 'compile_lngc' from replacing the file on Windows """
+    if isinstance(table, lngc.LngcTable) and table is not _translations:
+        table.close()
+
+
+def set_cache_budget(max_bytes : int):
+    """ How many bytes (estimated) the cached tables of recently used languages may take.
+    0 turns the cache off: every 'set_lang' loads the table again """
+    global _cache_budget
+    _cache_budget = max_bytes
+    with _cache_lock:
+        if max_bytes <= 0:
+            _clear_cache()
         else:
+            _evict_to_budget()
+
+
+def preload(languages : Iterable[str], lazy : bool = False) -> List[str]:
+    """ Loads the tables of the languages into the memory cache without changing
+    the active language (for example on a background thread before a preview),
+    so a later 'set_lang' to one of them is only a lookup. Returns the languages loaded """
+    loaded = []
+    for language in languages:
+        table, _, _ = _get_table(language, lazy, _fallback_chain)
+        if table is not None:
+            loaded.append(language)
+    return loaded
+
+
+def evict(languages : Optional[Iterable[str]] = None):
+    """ Removes the languages (all if None) from the memory cache.
+    The active table stays in use until the next 'set_lang' """
+    with _cache_lock:
+        if languages is None:
+            _clear_cache()
+            return
+        codes = {code.replace("-", "_") for code in languages}
+        for key in [key for key in _table_cache if key[0] in codes]:
+            _close_dropped(_table_cache.pop(key)["table"])
+
+
+def get_cache_info() -> List[Dict]:
+    """ Cached tables from the least to the most recently used: language, fallbacks,
+    lazy, number of keys, estimated bytes (measured again now) and whether it is active """
+    with _cache_lock:
+        items = list(_table_cache.items())
+    info = []
+    for (language, fallbacks, lazy), entry in items:
+        table = entry["table"]
+        entry["bytes"] = _table_memory(table)  # a lazy table grows as strings are requested
+        info.append({"language": language, "fallbacks": list(fallbacks), "lazy": lazy,
+                     "keys": _key_count(table), "bytes": entry["bytes"], "active": table is _translations})
+    return info
+
+
+def use_shared_registry(enabled : bool = True):
+    """ Join the registry shared by all add-ons that use this localization (see registry.py):
+    identical short strings of all their packs are kept once, the requested locales
+    are detected once, and 'set_lang_async' of all of them runs on one worker thread.
+    Takes effect at the next 'set_lang' (the memory cache is emptied) """
+    global _shared
+    if enabled or _shared:
+        from . import registry  # only with the shared registry, the module is optional
+        registry.set_addon_language(_addon_name, _language if enabled else None)
+    _shared = enabled
+    evict()
+
+
+def get_shared_info() -> Dict:
+    """ Add-ons in the shared registry, their languages and the size of the value pool """
+    from . import registry
+    return registry.get_info()
+
+
+def set_compact(enabled : bool = True):
+    """ Keep the loaded tables packed into one buffer per language ('compact.CompactTable'):
+    less memory for large packs, a value is decoded on its first request.
+    Takes effect at the next 'set_lang' (the memory cache is emptied) """
+    global _compact
+    _compact = enabled
+    evict()
+
+
+def set_fallback_chain(languages : Iterable[str]):
+    """ Languages used for the keys missing in the active language, in order,
+    for example ['pt_PT', 'en_US'] for 'pt_BR'. Takes effect at the next 'set_lang' """
+    global _fallback_chain
+    _fallback_chain = [code.replace("-", "_") for code in languages]
+
+
+def get_fallback_chain() -> List[str]:
+    return list(_fallback_chain)
+
+
+def default_fallback_chain(language : str) -> List[str]:
+    """ Other available packs of the same language, then BASE_LANGUAGE
+    ('pt_BR' -> ['pt_PT', 'pt', 'en_US'] if those files exist) """
+    language = language.replace("-", "_")
+    available = get_available_codes()
+    _, _, by_language = _get_negotiation_index(available)
+    chain = [code for code in by_language.get(language.split("_")[0].lower(), []) if code != language]
+    if BASE_LANGUAGE in available and BASE_LANGUAGE != language and BASE_LANGUAGE not in chain:
+        chain.append(BASE_LANGUAGE)
+    return chain
+
+
+def get_fallback_stats() -> List[Tuple[str, int]]:
+    """ (language, number of keys it supplied) for the active language and each
+    fallback of the last 'set_lang' """
+    return list(getattr(_load_stats, "fallbacks", []))
+
+
+def _publish(language : str, table : Mapping[str, str]):
+    """ Makes the table current. 'q' reads only '_translations', and replacing
+    one reference is atomic, so 'q' sees either the old or the new table """
+    global _language, _translations, _language_full_name, _prefix_index, _id_lookup
+    id_values = _get_id_values(table)
+    _id_lookup = None if id_values is None else (table, _id_keys, id_values)
+    _translations = table
+    _prefix_index = (None, [])
+    _language = language
+    _language_full_name = get_lang_full_name(language) 
+    if _shared:
+        from . import registry
+        registry.set_addon_language(_addon_name, language)
+
+
+def set_lang(language : str, lazy : bool = False):    
+    """ Set the addon localization language (only if the 'language.lng' file exists).
+    A compiled 'language.lngc' (see lngc.py) or 'language_lng.py' (see lngpy.py) is preferred,
+    in this order, when it is not older than the source.
+    Tables of recently used languages stay in a memory cache (see 'set_cache_budget'),
+    so switching back to one of them does not load it again.
+    With 'lazy' the strings are resolved only when 'q' first asks for them
+    (unless a fallback language adds keys: then one merged dictionary is built,
+    and the keys of the pack whose values have errors are also taken from the fallbacks) """
+    global _load_stats, _load_diagnostics, _load_generation
+    with _swap_lock:
+        _load_generation += 1  # a background load started earlier will not overwrite this choice
+        generation = _load_generation
+    result, stats, diagnostics = _get_table(language, lazy, _fallback_chain)
+    if stats is None:
+        return False     
+    with _swap_lock:
+        _load_stats = stats
+        _load_diagnostics = diagnostics
+        if result is None or generation != _load_generation:
             return False 
+        _publish(language, result)
+    return True
+
+
+def set_lang_async(language : str, on_done : Optional[Callable[[bool], None]] = None, lazy : bool = False):
+    """ Like 'set_lang', but the file is parsed on a background thread
+    (Anki's 'mw.taskman' if available). Until then 'q' serves the previous table,
+    the new one replaces it in one step. 'on_done(success)' is called after that:
+    with 'mw.taskman' on the main thread, otherwise on the worker thread.
+    If another 'set_lang' is called in the meantime, this result is discarded (success False).
+    With 'use_shared_registry' the load runs on the one worker shared by all add-ons """
+    global _load_generation, _executor
+    with _swap_lock:
+        _load_generation += 1
+        generation = _load_generation
+
+    fallbacks = list(_fallback_chain)
+
+    def task():
+        return _get_table(language, lazy, fallbacks)
+
+    def finish(future):
+        global _load_stats, _load_diagnostics
+        success = False
+        try:
+            result, stats, diagnostics = future.result()
+        except Exception:
+            result = stats = None
+        if stats is not None:
+            with _swap_lock:
+                if generation == _load_generation:
+                    _load_stats = stats
+                    _load_diagnostics = diagnostics
+                    if result is not None:
+                        _publish(language, result)
+                        success = True
+        if on_done is not None:
+            on_done(success)
+
+    taskman = getattr(_get_mw(), "taskman", None)
+    if _shared:
+        # the loads of all add-ons are queued on one thread, the results come back
+        # to the main thread inside Anki
+        if taskman is not None:
+            done = lambda future: taskman.run_on_main(lambda: finish(future))
+        else:
+            done = finish
+        from . import registry
+        registry.get_executor().submit(task).add_done_callback(done)
+    elif taskman is not None:
+        taskman.run_in_background(task, finish)
+    else:
+        if _executor is None:
+            import concurrent.futures
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "lang")
+        _executor.submit(task).add_done_callback(finish)
+
+
+def _get_id_values(table : Mapping[str, str]) -> Optional[list]:
+    """ List of the values of the table by key ID (None if IDs are not used).
+    'qi' reads a value from the table on its first request, so a lazy or .lngc table
+    is not read as a whole. The list is kept with the table in the memory cache """
+    id_keys = _id_keys
+    if id_keys is None:
+        return None
+    with _cache_lock:
+        entry = next((entry for entry in _table_cache.values() if entry["table"] is table), None)
+        if entry is not None and entry.get("id_keys") is id_keys:
+            return entry["id_values"]
+        values = [_UNREAD] * len(id_keys)
+        if entry is not None:
+            entry["id_keys"] = id_keys
+            entry["id_values"] = values
+    return values
+
+
+def use_key_ids(registry_path : Optional[str] = None):
+    """ Turns on lookups by integer key ID ('qi'). The IDs come from the registry
+    written by 'keygen.py --ids' (by default 'keyids.json' next to this module).
+    After that every language also gets a list indexed by ID, filled as the IDs are requested """
+    global _id_keys, _id_lookup
+    from . import keygen
+    if registry_path is None:
+        registry_path = os.path.join(_lang_dir(), keygen.KEYIDS_FILE)
+    id_keys = keygen.read_key_ids(registry_path)
+    with _swap_lock:
+        _id_keys = id_keys
+        _id_lookup = (_translations, id_keys, _get_id_values(_translations))
 
 
 def q(key: str, default: str = "") -> str:
@@ -45,10 +474,124 @@ def q(key: str, default: str = "") -> str:
         default = key    
     return _translations.get(key, default)
 
+def qi(key_id: int, default: str = "") -> str:
+    """Translation by integer key ID (constants of the module generated by 'keygen.py --ids'):
+    one list index, no hashing of the key (after the first request of the ID)"""
+    lookup = _id_lookup
+    if lookup is None:
+        raise RuntimeError("key IDs are not turned on, call 'lang.use_key_ids' first")
+    table, id_keys, values = lookup
+    value = values[key_id]
+    if value is _UNREAD:
+        value = values[key_id] = table.get(id_keys[key_id])  # the same value if two threads do it
+    return default if value is None else value
+
+
 def get_translation(key: str, default: str = "") -> str:
     """Get translation for a key with optional default value (long function name _)"""
     return q(key, default)
 
+
+def q_many(keys: Iterable[str], default: str = "", defaults: Optional[Mapping[str, str]] = None,
+           missing: Optional[List[str]] = None) -> Tuple[str, ...]:
+    """Translations of many keys in one call, in the same order.
+    'defaults' -values for particular keys if they are missing (otherwise 'default'),
+    'missing' -if a list is given, the keys not found are added to it"""
+    table = _translations  # the same table for the whole batch
+    get = table.get
+    result = []
+    for key in keys:
+        key = key.strip()
+        value = get(key)
+        if value is None:
+            if missing is not None:
+                missing.append(key)
+            value = defaults.get(key, default) if defaults else default
+        result.append(value)
+    return tuple(result)
+
+
+_prefix_index = (None, []) # (table, its sorted keys) for 'q_prefix'
+
+def _sorted_keys(table: Mapping[str, str]) -> List[str]:
+    """Sorted keys of the table (built once per table)"""
+    global _prefix_index
+    if _prefix_index[0] is not table:
+        _prefix_index = (table, sorted(table))
+    return _prefix_index[1]
+
+
+def q_prefix(prefix: str, strip_prefix: bool = False) -> Dict[str, str]:
+    """All translations whose keys start with 'prefix' (a namespace such as 'q_menu_'),
+    with 'strip_prefix' the keys are returned without it"""
+    table = _translations
+    keys = _sorted_keys(table)
+    result = {}
+    cut = len(prefix) if strip_prefix else 0
+    for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+        key = keys[i]
+        if not key.startswith(prefix):
+            break
+        value = table.get(key)
+        if value is not None:  # a lazy table skips keys with errors
+            result[key[cut:]] = value
+    return result
+
+
+class QStrings:
+    """Strings of one batch: as attributes (s.q_Card_internal) or by key (s["q_Card_internal"]).
+    'missing' -keys that were not found (they have the default value).
+    Keys named 'missing' or '_values' are only available as s["missing"]"""
+
+    # the internals are slots: a slot wins over the instance dict with the
+    # strings, so a key of the same name cannot replace them
+    __slots__ = ("_values", "missing", "__dict__")
+
+    def __init__(self, values: Dict[str, str], missing: Tuple[str, ...] = ()):
+        self._values = values
+        self.missing = missing
+        self.__dict__.update(values)
+
+    def __getitem__(self, key: str) -> str:
+        return self._values[key]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __repr__(self) -> str:
+        return f"QStrings({len(self._values)} strings, missing={list(self.missing)})"
+
+
+def q_batch(keys: Iterable[str] = (), prefix: Optional[str] = None, strip_prefix: bool = False,
+            default: str = "", defaults: Optional[Mapping[str, str]] = None) -> QStrings:
+    """Strings for building a menu or a dialog in one call: the given keys and/or
+    all keys of a namespace 'prefix'. len() of the result shows how many strings were pulled"""
+    keys = [key.strip() for key in keys]
+    missing: List[str] = []
+    values = dict(zip(keys, q_many(keys, default, defaults, missing)))
+    if prefix is not None:
+        values.update(q_prefix(prefix, strip_prefix))
+    return QStrings(values, tuple(missing))
+
+
+def get_strings(strings_class, default: str = ""):
+    """Object of the generated 'Strings' class (see keygen.py) filled from the
+    current language: s.q_Card_internal is a plain attribute read.
+    Create it again after 'set_lang'"""
+    return strings_class(_translations, default)
+
+def get_load_stats() -> adv_settings.ParseStats:
+    """ Timings and counters of the last 'set_lang' (also of a failed one) """
+    return _load_stats
+
+def get_load_diagnostics() -> adv_settings.Diagnostics:
+    """ Warnings and errors of the last 'set_lang' (for a lazy load they are
+    added as the strings are requested) """
+    return _load_diagnostics
+
 def get_lang() -> str:
     """ Get the addon's localization language """
     global _language
@@ -56,51 +599,319 @@ def get_lang() -> str:
 
 def get_lang_full_name(language : str) -> str:
     """ Get the full name of the add-on's localization language """
-    global langs, compatMapSort 
-    langs_dict = {code: name for name, code in langs} 
-    compatMap_dict = {code2sm: code4sm for code2sm, code4sm in compatMapSort} 
-    if language in langs_dict: 
-        return langs_dict[language]  
-    elif language in compatMap_dict:
-        cd4 = compatMap_dict[language]  
-        if cd4 in langs_dict: 
-            return langs_dict[cd4]
-    return language   
+    name = _lang_names.get(language)
+    if name is None:
+        cd4 = _compat_map.get(language)
+        name = _lang_names.get(cd4, language) if cd4 else language
+    return name
     
 
-def get_available_languages() -> List[Tuple[str, str]]:
+MANIFEST_FILE = "languages.json" # Prebuilt manifest of the languages (see 'build_language_manifest')
+BASE_LANGUAGE = "en_US" # The language other packs are compared with ('completeness')
+
+_available_codes: Optional[List[str]] = None # Language codes of the files
+_available_mtime = None # Modification time of the folder when the codes were read
+_manifest: Optional[List[Dict]] = None # Manifest of the languages
+_manifest_mtime = None
+
+def _lang_dir() -> str:
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def _dir_mtime():
+    """ Modification time of the folder: changes when files are added, removed or renamed """
+    try:
+        return os.stat(_lang_dir()).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _scan_available_codes() -> List[str]:
+    """ Language codes of the translation files ('.lng', compiled '.lngc' or '_lng.py') next to this module """
+    codes = set()
+    for filename in os.listdir(_lang_dir()):
+        base, ext = os.path.splitext(filename)
+        if ext.lower() in (".lng", ".lngc"):
+            codes.add(base)
+        elif filename.endswith(lngpy.MODULE_SUFFIX):
+            codes.add(filename[:-len(lngpy.MODULE_SUFFIX)])
+    return sorted(codes)
+
+
+def get_available_codes(refresh : bool = False, check : bool = True) -> List[str]:
+    """ Language codes of the available translation files.
+    The folder is listed again only if its modification time has changed
+    (or with 'refresh'); with 'check=False' the folder is not touched at all
+    once the codes have been read """
+    global _available_codes, _available_mtime
+    if _available_codes is not None and not refresh and not check:
+        return _available_codes
+    mtime = _dir_mtime()
+    if _available_codes is None or refresh or mtime != _available_mtime:
+        _available_codes = _scan_available_codes()
+        _available_mtime = mtime
+    return _available_codes
+
+
+def get_available_languages(refresh : bool = False) -> List[Tuple[str, str]]:
     """
     Get all available translation files in the current directory.
     Returns:
         List of tuples (language_name, language_code) for available 'lng' files.
         If language name not found in langs list, uses filename as both name and code.
     """   
-    global langs, compatMapSort 
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    langs_dict = {code: name for name, code in langs} 
-    compatMap_dict = {code2sm: code4sm for code2sm, code4sm in compatMapSort}       
-    available = []
-    
-    # Search for all 'lng' files in the directory
-    for filename in os.listdir(current_dir):
-        if filename.lower().endswith('.lng'):
-            # Extracting the language code from a file name (without extension)
-            language = filename[:-5]  # del ".lng"                 
-            if language in langs_dict: 
-                available.append(langs_dict[language], language)   
-            elif language in compatMap_dict:
-                cd4 = compatMap_dict[language]  
-                if cd4 in langs_dict: 
-                    available.append(langs_dict[cd4], language)
-                else:
-                    available.append(language, language)
-            else:
-                available.append(language, language)
-                
+    available = [(get_lang_full_name(code), code) for code in get_available_codes(refresh)]
     available.sort(key=lambda x: x[0].lower())
     return available
 
 
+def _artifact_status(source_mtime, path : str) -> str:
+    """ 'fresh' if the compiled file is not older than the source, 'stale' or 'none' """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return "none"
+    return "fresh" if source_mtime is None or mtime >= source_mtime else "stale"
+
+
+def _peek_table(code : str, parse : bool = False) -> Optional[Mapping[str, str]]:
+    """ Table of the language from a compiled file (.lngc or the compiled cache)
+    without parsing. With 'parse' the .lng file is parsed if there is nothing compiled """
+    lng_path = os.path.join(_lang_dir(), f"{code}.lng")
+    table = lngc.open_compiled(lng_path)
+    if table is None:
+        table = lngpy.open_module(lng_path)
+    if table is None:
+        table = adv_settings.read_cached(lng_path)
+    if table is None and parse and os.path.isfile(lng_path):
+        table = adv_settings.load_lng(lng_path, use_cache = True) or None
+    return table
+
+
+def _manifest_entry(code : str, base_keys, parse : bool = False) -> Dict:
+    """ Description of one language for the manifest """
+    lng_path = os.path.join(_lang_dir(), f"{code}.lng")
+    try:
+        st = os.stat(lng_path)
+        size, mtime = st.st_size, st.st_mtime_ns
+    except OSError:
+        size = mtime = None  # only .lngc is shipped
+    table = _peek_table(code, parse)
+    keys = completeness = None
+    if table is not None:
+        keys = len(table)
+        base = base_keys()
+        if base:
+            completeness = round(sum(1 for key in base if key in table) / len(base), 4)
+        if isinstance(table, lngc.LngcTable):
+            table.close()
+    return {
+        "code": code,
+        "name": get_lang_full_name(code),
+        "size": size,
+        "keys": keys,  # None -nothing compiled yet, the file would have to be parsed
+        "completeness": completeness,  # share of the base language keys present
+        "cache": _artifact_status(mtime, adv_settings.get_cache_path(lng_path)),
+        "lngc": _artifact_status(mtime, os.path.join(_lang_dir(), f"{code}.lngc")),
+        "module": _artifact_status(mtime, lngpy.get_module_path(lng_path)),
+    }
+
+
+def _read_manifest_file() -> Dict[str, Dict]:
+    """ Entries of the prebuilt 'languages.json' by language code ({} if there is none) """
+    import json
+    try:
+        with open(os.path.join(_lang_dir(), MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {entry["code"]: entry for entry in data.get("languages", [])}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+
+def get_language_manifest(refresh : bool = False) -> List[Dict]:
+    """ Description of each available language for a language picker: code, name,
+    number of keys, completeness against BASE_LANGUAGE and the status of the compiled
+    files ('fresh', 'stale', 'none'). No .lng file is parsed: the numbers come from the
+    prebuilt 'languages.json' (if the size of the file matches) or from compiled files,
+    otherwise they are None. Rebuilt only when the folder modification time changes """
+    global _manifest, _manifest_mtime
+    mtime = _dir_mtime()
+    if _manifest is not None and not refresh and mtime == _manifest_mtime:
+        return _manifest
+    shipped = _read_manifest_file()
+    codes = get_available_codes(refresh = True)
+
+    base_cache = []
+    def base_keys():
+        if not base_cache:
+            base_code = negotiate_lang([BASE_LANGUAGE], codes)
+            base = _peek_table(base_code) if base_code else None
+            base_cache.append(list(base) if base is not None else None)
+            if isinstance(base, lngc.LngcTable):
+                base.close()
+        return base_cache[0]
+
+    manifest = []
+    for code in codes:
+        entry = shipped.get(code)
+        if entry is not None:
+            try:
+                size = os.stat(os.path.join(_lang_dir(), f"{code}.lng")).st_size
+            except OSError:
+                size = None
+            if entry.get("size") != size:
+                entry = None  # the file was changed after the manifest was built
+        if entry is None:
+            entry = _manifest_entry(code, base_keys)
+        manifest.append(entry)
+    _manifest = manifest
+    _manifest_mtime = mtime
+    return manifest
+
+
+def build_language_manifest(write : bool = True) -> List[Dict]:
+    """ Parses all packs (using the compiled files where possible) and returns
+    the full manifest; with 'write' it is saved to 'languages.json' to be shipped
+    with the add-on """
+    global _manifest, _manifest_mtime
+    codes = get_available_codes(refresh = True)
+    base_code = negotiate_lang([BASE_LANGUAGE], codes)
+    base = _peek_table(base_code, parse = True) if base_code else None
+    base_list = list(base) if base is not None else None
+    manifest = [_manifest_entry(code, lambda: base_list, parse = True) for code in codes]
+    if write:
+        import json
+        path = os.path.join(_lang_dir(), MANIFEST_FILE)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"base": base_code, "languages": manifest}, f, ensure_ascii=False, indent=1)
+    _manifest = manifest
+    _manifest_mtime = _dir_mtime()
+    return manifest
+
+
+def normalize_locale(locale_name : str) -> str:
+    """ Brings a locale to the form of file names: 'pt-br' -> 'pt_BR', 'zh-hant-tw' -> 'zh_Hant_TW',
+    'de_DE.UTF-8@euro' -> 'de_DE'. Returns '' for 'C' and 'POSIX' """
+    tag = locale_name.strip().split(".")[0].split("@")[0].replace("-", "_")
+    if not tag or tag in ("C", "POSIX"):
+        return ""
+    parts = [part for part in tag.split("_") if part]
+    if not parts:
+        return ""
+    result = [parts[0].lower()]
+    for part in parts[1:]:
+        if len(part) == 4 and part.isalpha():
+            result.append(part.title())  # script
+        elif len(part) in (2, 3):
+            result.append(part.upper())  # region ('BR' or '419')
+        else:
+            result.append(part)
+    return "_".join(result)
+
+
+# A script that defines the region of the file ('zh_Hant' -> 'zh_TW')
+_SCRIPT_REGIONS = {("zh", "Hant"): "TW", ("zh", "Hans"): "CN"}
+# And the script of a region without its own file ('zh_HK' -> 'zh_Hant' -> 'zh_TW')
+_REGION_SCRIPTS = {("zh", "TW"): "Hant", ("zh", "HK"): "Hant", ("zh", "MO"): "Hant",
+                   ("zh", "CN"): "Hans", ("zh", "SG"): "Hans"}
+
+def _locale_candidates(locale_name : str) -> List[str]:
+    """ File codes to try for one locale, from the most to the least exact """
+    tag = normalize_locale(locale_name)
+    if not tag:
+        return []
+    parts = tag.split("_")
+    language = parts[0]
+    script = next((part for part in parts[1:] if len(part) == 4), None)
+    region = next((part for part in parts[1:] if len(part) != 4), None)
+    if script is None and region is not None:
+        script = _REGION_SCRIPTS.get((language, region))
+    candidates = [tag]
+    if region:
+        candidates.append(f"{language}_{region}")
+    if script:
+        candidates.append(f"{language}_{script}")
+        script_region = _SCRIPT_REGIONS.get((language, script))
+        if script_region:
+            candidates.append(f"{language}_{script_region}")
+    candidates.append(language)
+    if language in _compat_map:
+        candidates.append(_compat_map[language])
+    return list(dict.fromkeys(candidates))
+
+
+_negotiation_index = (None, {}, {}) # (codes, lowercase code -> code, language -> codes)
+
+def _get_negotiation_index(available : List[str]):
+    """ Indexes of the available codes (rebuilt only when the list changes) """
+    global _negotiation_index
+    if _negotiation_index[0] != available:
+        by_lower = {}
+        by_language: Dict[str, List[str]] = {}
+        for code in available:
+            by_lower[code.lower()] = code
+            by_language.setdefault(code.split("_")[0].lower(), []).append(code)
+        _negotiation_index = (list(available), by_lower, by_language)
+    return _negotiation_index
+
+
+def negotiate_lang(requested : Iterable[str], available : Optional[Iterable[str]] = None) -> Optional[str]:
+    """ Chooses the best available translation for an ordered list of locales
+    (for example, Anki's language, then the system ones). For each locale in turn:
+    exact code, script/region fallback, the language alone, the compatibility map
+    and finally any file of the same language. None if nothing fits.
+    The files are not read again (see 'get_available_codes') """
+    if available is None:
+        available = get_available_codes(check = False)
+    _, by_lower, by_language = _get_negotiation_index(list(available))
+    for locale_name in requested:
+        if not locale_name:
+            continue
+        candidates = _locale_candidates(locale_name)
+        for candidate in candidates:
+            code = by_lower.get(candidate.lower())
+            if code is not None:
+                return code
+        if candidates:
+            same_language = by_language.get(candidates[-1].split("_")[0].lower())
+            if same_language:
+                return same_language[0]
+    return None
+
+
+def get_requested_locales(refresh : bool = False) -> List[str]:
+    """ Locales in order of preference: Anki's interface language, then the system ones.
+    With 'use_shared_registry' they are detected once for all add-ons ('refresh' detects again) """
+    if _shared:
+        from . import registry
+        return registry.get_requested_locales(_detect_requested_locales, refresh)
+    return _detect_requested_locales()
+
+
+def _detect_requested_locales() -> List[str]:
+    requested = []
+    anki_lang = _get_anki_lang()
+    if anki_lang:
+        requested.append(anki_lang)
+    for var in ("LANGUAGE", "LC_ALL", "LC_MESSAGES", "LANG"):
+        value = os.environ.get(var)
+        if value:
+            requested.extend(value.split(":"))  # LANGUAGE may contain a list
+    import locale
+    try:
+        system_lang = locale.getlocale()[0]
+    except ValueError:
+        system_lang = None
+    if system_lang:
+        requested.append(system_lang)
+    return requested
+
+
+def detect_lang() -> Optional[str]:
+    """ The best available translation for Anki's and the system's language (or None) """
+    return negotiate_lang(get_requested_locales())
+
+
 
 langs = sorted(
     [
@@ -212,3 +1023,7 @@ compatMapSort = sorted(
     ]
 )
 
+
+# Indexes of the lists above, built once
+_lang_names: Dict[str, str] = {code: name for name, code in langs}
+_compat_map: Dict[str, str] = {code2sm: code4sm for code2sm, code4sm in compatMapSort}
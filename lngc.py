@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" compiled indexed translation format '.lngc' (read through mmap) """
+
+# File layout (all numbers are little-endian):
+#   header: magic b"LNGC", format version, parser version, number of keys,
+#           number of slots, offset of the string heap
+#   slots:  hash table with open addressing, for each slot:
+#           crc32 of the key, key offset, key length, value offset, value length
+#           (an empty slot has key length 0, the keys are never empty)
+#   heap:   UTF-8 bytes of the keys and values, offsets are counted from its start
+#
+# A lookup reads only one or a few slots and the bytes of the found value,
+# so neither the load time nor the memory depend on the size of the pack.
+
+import os
+import sys
+import mmap
+import struct
+import zlib
+from collections.abc import Mapping
+from typing import Dict, Optional
+
+try:
+    from . import adv_settings
+except ImportError:  # run as a script
+    import adv_settings
+
+LNGC_MAGIC = b"LNGC"
+LNGC_VERSION = 1
+
+_HEADER = struct.Struct("<4sIIIII")
+_SLOT = struct.Struct("<IIIII")
+
+
+def write_lngc(table: Mapping, lngc_path: str):
+    """Writes the key->value dictionary to a '.lngc' file (atomically, via a temporary file)"""
+    count = len(table)
+    slot_count = 8
+    while slot_count < count * 2:  # the table is filled no more than half
+        slot_count *= 2
+    mask = slot_count - 1
+
+    slots = [None] * slot_count
+    heap = bytearray()
+    for key, value in table.items():
+        key_bytes = key.encode('utf-8')
+        value_bytes = value.encode('utf-8')
+        key_hash = zlib.crc32(key_bytes)
+        i = key_hash & mask
+        while slots[i] is not None:
+            i = (i + 1) & mask
+        slots[i] = (key_hash, len(heap), len(key_bytes), len(heap) + len(key_bytes), len(value_bytes))
+        heap += key_bytes
+        heap += value_bytes
+
+    heap_offset = _HEADER.size + slot_count * _SLOT.size
+    data = bytearray(_HEADER.pack(LNGC_MAGIC, LNGC_VERSION, adv_settings.PARSER_VERSION,
+                                  count, slot_count, heap_offset))
+    empty = _SLOT.pack(0, 0, 0, 0, 0)
+    for slot in slots:
+        data += empty if slot is None else _SLOT.pack(*slot)
+    data += heap
+    adv_settings.write_file_atomic(lngc_path, data)
+
+
+def compile_lngc(lng_path: str, lngc_path: Optional[str] = None,
+                 logging_to_screen: bool = False) -> bool:
+    """Parses the .lng file and writes it as '.lngc' next to it.
+    Returns False if the file has errors (then nothing is written)"""
+    if lngc_path is None:
+        lngc_path = os.path.splitext(lng_path)[0] + ".lngc"
+    table = adv_settings.load_lng(lng_path, logging_to_screen=logging_to_screen)
+    if not table:
+        return False
+    write_lngc(table, lngc_path)
+    return True
+
+
+class LngcTable(Mapping):
+    """Read-only key->value dictionary over an mmap of a '.lngc' file.
+    Only the values actually requested are decoded (and remembered)"""
+
+    def __init__(self, lngc_path: str):
+        self.path = lngc_path
+        with open(lngc_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, parser_version, count, slot_count, heap_offset = _HEADER.unpack_from(self._mm, 0)
+            if magic != LNGC_MAGIC or version != LNGC_VERSION:
+                raise ValueError(f"not a .lngc file of version {LNGC_VERSION}: {lngc_path}")
+            if slot_count & (slot_count - 1) or heap_offset != _HEADER.size + slot_count * _SLOT.size:
+                raise ValueError(f"damaged .lngc file: {lngc_path}")
+        except (struct.error, ValueError):
+            self._mm.close()
+            raise
+        self.parser_version = parser_version
+        self._count = count
+        self._mask = slot_count - 1
+        self._heap = heap_offset
+        self._hot: Dict[str, str] = {}  # already decoded values
+
+    def _find(self, key: str) -> Optional[str]:
+        mm = self._mm
+        heap = self._heap
+        key_bytes = key.encode('utf-8')
+        key_len = len(key_bytes)
+        key_hash = zlib.crc32(key_bytes)
+        mask = self._mask
+        i = key_hash & mask
+        while True:
+            slot_hash, k_off, k_len, v_off, v_len = _SLOT.unpack_from(mm, _HEADER.size + i * _SLOT.size)
+            if k_len == 0:
+                return None
+            if slot_hash == key_hash and k_len == key_len and mm[heap + k_off:heap + k_off + k_len] == key_bytes:
+                value = mm[heap + v_off:heap + v_off + v_len].decode('utf-8')
+                self._hot[key] = value
+                return value
+            i = (i + 1) & mask
+
+    def get(self, key: str, default=None):
+        value = self._hot.get(key)
+        if value is None:
+            value = self._find(key)
+            if value is None:
+                return default
+        return value
+
+    def __getitem__(self, key: str) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self.get(key) is not None
+
+    def __iter__(self):
+        """Keys in the order of the hash table (not the order of the file)"""
+        mm = self._mm
+        heap = self._heap
+        for i in range(self._mask + 1):
+            _, k_off, k_len, _, _ = _SLOT.unpack_from(mm, _HEADER.size + i * _SLOT.size)
+            if k_len:
+                yield mm[heap + k_off:heap + k_off + k_len].decode('utf-8')
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        """Releases the mmap (on Windows the file cannot be replaced while it is open)"""
+        self._hot.clear()
+        self._mm.close()
+
+
+def open_compiled(lng_path: str) -> Optional[LngcTable]:
+    """Opens the '.lngc' file next to the .lng file if it is not older than the source
+    (or there is no source) and was compiled by the current parser version.
+    Otherwise None"""
+    lngc_path = os.path.splitext(lng_path)[0] + ".lngc"
+    try:
+        lngc_mtime = os.stat(lngc_path).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        if os.stat(lng_path).st_mtime_ns > lngc_mtime:
+            return None  # the source was edited after compilation
+    except OSError:
+        pass  # only the compiled file is shipped
+    try:
+        table = LngcTable(lngc_path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if table.parser_version != adv_settings.PARSER_VERSION:
+        table.close()
+        return None
+    return table
+
+
+# Compilation from the command line: python lngc.py file.lng [file.lngc]
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python lngc.py file.lng [file.lngc]")
+        sys.exit(1)
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    if not compile_lngc(source, target, logging_to_screen=True):
+        print(f"Error: '{source}' was not compiled")
+        sys.exit(1)
+    print(f"Compiled: {target or os.path.splitext(source)[0] + '.lngc'}")
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" compilation of a .lng file to an importable Python module '<code>_lng.py' """
+
+# The module holds the final dictionary as a literal:
+#   PARSER_VERSION = ...   (adv_settings.PARSER_VERSION of the compiling parser)
+#   TRANSLATIONS = {'key': 'value', ...}
+# It is loaded with the usual import machinery, so after the first load Python
+# keeps its bytecode in __pycache__ (written already by the compilation) and a start
+# only unmarshals the .pyc (no reading of text and no parsing of the .lng file).
+
+import os
+import sys
+from collections.abc import Mapping
+from typing import Dict, Optional
+
+try:
+    from . import adv_settings
+except ImportError:  # run as a script
+    import adv_settings
+
+MODULE_SUFFIX = "_lng.py"
+
+
+def get_module_path(lng_path: str) -> str:
+    """Path of the compiled module for the .lng file ('ru_RU.lng' -> 'ru_RU_lng.py')"""
+    return os.path.splitext(lng_path)[0] + MODULE_SUFFIX
+
+
+def write_module(table: Mapping, module_path: str, source_name: str = ""):
+    """Writes the key->value dictionary as a Python module (atomically, via a temporary file)
+    and compiles its bytecode right away (also when writing of .pyc files is turned off)"""
+    lines = [
+        "# -*- coding: utf-8 -*-",
+        f"# Generated by lngpy.py from '{source_name}', do not edit.",
+        f"PARSER_VERSION = {adv_settings.PARSER_VERSION}",
+        "TRANSLATIONS = {",
+    ]
+    for key, value in table.items():
+        lines.append(f"    {key!r}: {value!r},")
+    lines.append("}")
+    lines.append("")
+    adv_settings.write_file_atomic(module_path, "\n".join(lines))
+    import py_compile
+    try:
+        py_compile.compile(module_path, doraise=True)
+    except (OSError, py_compile.PyCompileError):
+        pass  # it will be compiled on the first import
+
+
+def compile_module(lng_path: str, module_path: Optional[str] = None,
+                   logging_to_screen: bool = False) -> bool:
+    """Parses the .lng file and writes it as '<code>_lng.py' next to it.
+    Returns False if the file has errors (then nothing is written)"""
+    if module_path is None:
+        module_path = get_module_path(lng_path)
+    table = adv_settings.load_lng(lng_path, logging_to_screen=logging_to_screen)
+    if not table:
+        return False
+    write_module(table, module_path, os.path.basename(lng_path))
+    return True
+
+
+def open_module(lng_path: str) -> Optional[Dict[str, str]]:
+    """Dictionary from the compiled module next to the .lng file if the module is
+    not older than the source (or there is no source) and was compiled by the
+    current parser version. Otherwise None"""
+    module_path = get_module_path(lng_path)
+    try:
+        module_mtime = os.stat(module_path).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        if os.stat(lng_path).st_mtime_ns > module_mtime:
+            return None  # the source was edited after compilation
+    except OSError:
+        pass  # only the compiled module is shipped
+    import importlib.util
+    name = "_lng_" + os.path.basename(module_path)[:-len(MODULE_SUFFIX)]
+    try:
+        spec = importlib.util.spec_from_file_location(name, module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)  # reads or writes the .pyc in __pycache__
+    except Exception:
+        return None
+    table = getattr(module, "TRANSLATIONS", None)
+    if getattr(module, "PARSER_VERSION", None) != adv_settings.PARSER_VERSION or not isinstance(table, dict):
+        return None
+    return table
+
+
+# Compilation from the command line: python lngpy.py file.lng [file_lng.py]
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python lngpy.py file.lng [file_lng.py]")
+        sys.exit(1)
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    if not compile_module(source, target, logging_to_screen=True):
+        print(f"Error: '{source}' was not compiled")
+        sys.exit(1)
+    print(f"Compiled: {target or get_module_path(source)}")
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Copyright: (C) kaiu <https://github.com/AndreyKaiu>
+# License: GNU GPL version 3 or later <https://www.fsf.org/>
+""" process-wide registry shared by all add-ons that use this localization """
+
+# Every add-on vendors its own copy of lang.py, so every copy has its own
+# globals. The registry is one module object in 'sys.modules' under a
+# well-known name: the first copy that asks for it creates it, the others
+# (also older or newer copies of this file) find it there. It holds only
+# objects of the standard library:
+#   - values: pool of short translated strings, an identical value of any
+#     add-on ("OK", "Cancel", "Anki") is kept as one str object
+#   - requested_locales: the locales detected once for all add-ons
+#   - executor: one background worker that loads the packs of all add-ons
+#   - addons: package of the add-on -> its active language
+# Attributes are only added in later versions, never renamed, so a copy uses
+# 'getattr' with a default for anything newer than REGISTRY_VERSION 1.
+
+import sys
+import types
+import threading
+from typing import Callable, Dict, List, Optional
+
+REGISTRY_NAME = "anki_addon_localization_registry" # key in sys.modules
+REGISTRY_VERSION = 1
+SHARED_VALUE_MAX = 64 # longer values are rarely identical across add-ons and are not pooled
+SHARED_POOL_LIMIT = 50000 # values pooled at most (later ones are kept as they are)
+
+_create_lock = threading.Lock()
+
+
+def get_registry() -> types.ModuleType:
+    """The registry of the process (created on the first call)"""
+    registry = sys.modules.get(REGISTRY_NAME)
+    if registry is not None:
+        return registry
+    with _create_lock:  # other copies have their own lock, 'setdefault' decides between them
+        registry = types.ModuleType(REGISTRY_NAME, "shared localization registry of Anki add-ons")
+        registry.version = REGISTRY_VERSION
+        registry.lock = threading.RLock()
+        registry.values = {}
+        registry.requested_locales = None
+        registry.executor = None
+        registry.addons = {}
+        return sys.modules.setdefault(REGISTRY_NAME, registry)
+
+
+def share_values(table: Dict[str, str]) -> int:
+    """Replaces short values of the dictionary (in place) with the identical
+    strings already in the pool. Returns the number of values that were shared"""
+    pool = get_registry().values
+    shared = 0
+    for key, value in table.items():
+        if len(value) > SHARED_VALUE_MAX:
+            continue
+        pooled = pool.get(value)
+        if pooled is None:
+            if len(pool) < SHARED_POOL_LIMIT:
+                pool.setdefault(value, value)  # atomic, a concurrent copy may win
+        elif pooled is not value:
+            table[key] = pooled  # the same keys, so the dict does not change size
+            shared += 1
+    return shared
+
+
+def get_requested_locales(detect: Callable[[], List[str]], refresh: bool = False) -> List[str]:
+    """Locales detected by the first add-on that asked ('detect' is called only
+    then, or with 'refresh')"""
+    registry = get_registry()
+    with registry.lock:
+        if refresh or registry.requested_locales is None:
+            registry.requested_locales = tuple(detect())
+        return list(registry.requested_locales)
+
+
+def get_executor():
+    """The one background worker for the pack loads of all add-ons"""
+    registry = get_registry()
+    with registry.lock:
+        if registry.executor is None:
+            import concurrent.futures
+            registry.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="lang-shared")
+        return registry.executor
+
+
+def set_addon_language(addon: str, language: Optional[str]):
+    """Records the active language of the add-on (None -the add-on has left)"""
+    addons = get_registry().addons
+    if language is None:
+        addons.pop(addon, None)
+    else:
+        addons[addon] = language
+
+
+def get_info() -> Dict:
+    """Add-ons in the registry with their languages, and the size of the value pool"""
+    registry = get_registry()
+    return {"version": registry.version, "addons": dict(registry.addons),
+            "values": len(registry.values),
+            "requested_locales": list(registry.requested_locales or ())}